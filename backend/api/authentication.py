@@ -0,0 +1,105 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Ограниченный LRU-кэш токенов с временем жизни записей."""
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            keys = [key for key, (_, (user, _, _)) in self._entries.items()
+                    if user.pk == user_id]
+            for key in keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE,
+                         settings.TOKEN_CACHE_TIMEOUT)
+
+
+def get_token_marker(key):
+    return f'token_revoked_{key}'
+
+
+def get_user_marker(user_id):
+    return f'token_user_{user_id}'
+
+
+def _mark(marker):
+    cache.set(marker, time.time_ns(), settings.TOKEN_CACHE_TIMEOUT)
+
+
+def revoke_token(key):
+    """Сбрасывает токен в кэшах всех воркеров после фиксации транзакции."""
+    token_cache.delete(key)
+    transaction.on_commit(lambda: _mark(get_token_marker(key)))
+
+
+def revoke_user_tokens(user_id):
+    """Сбрасывает токены пользователя в кэшах всех воркеров."""
+    token_cache.delete_user(user_id)
+    transaction.on_commit(lambda: _mark(get_user_marker(user_id)))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кэшированием пользователя.
+
+    Кэш локален для процесса. Удаление токена или изменение пользователя
+    оставляет в общем кэше отметку со временем изменения, и запись,
+    загруженная раньше неё, в любом воркере загружается из базы заново.
+    Каждый запрос получает свою копию пользователя.
+    """
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user, token, loaded = entry
+            markers = cache.get_many(
+                [get_token_marker(key), get_user_marker(user.pk)])
+            if all(marker < loaded for marker in markers.values()):
+                return copy.copy(user), token
+            token_cache.delete(key)
+        # Время до чтения из базы: изменение, зафиксированное во время
+        # чтения, тоже считается более поздним.
+        loaded = time.time_ns()
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token, loaded))
+        return copy.copy(user), token
@@ -0,0 +1,51 @@
+import threading
+from contextlib import contextmanager
+
+from api.representations import build_cards
+from recipes.models import Change, Recipe
+
+_state = threading.local()
+
+
+def refresh_cards(recipe_ids, batch_size=500, record_changes=True):
+    """Перестраивает и сохраняет карточки рецептов recipe_ids.
+
+    Карточка меняется вместе с представлением рецепта, поэтому здесь же
+    рецепты записываются в ленту изменений /api/sync/. Удалённые рецепты
+    пропускаются: их удаление записывает сигнал post_delete.
+    """
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), batch_size):
+        cards = build_cards(recipe_ids[start:start + batch_size])
+        Recipe.objects.bulk_update(
+            [Recipe(id=recipe_id, card=card)
+             for recipe_id, card in cards.items()], ['card'])
+        if record_changes:
+            Change.record_many(Change.RECIPE, cards)
+
+
+@contextmanager
+def deferred_refresh():
+    """Обновляет карточки один раз в конце блока, а не после каждой записи.
+
+    Блок должен выполняться внутри транзакции, чтобы карточки менялись
+    вместе с данными.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    refresh_cards(pending)
+
+
+def schedule_refresh(recipe_ids):
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        refresh_cards(recipe_ids)
+    else:
+        pending.update(recipe_ids)
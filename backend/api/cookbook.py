@@ -0,0 +1,271 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.core.cache import cache, caches
+from rest_framework.exceptions import Throttled
+
+from api.representations import build_cards
+from api.throttling import concurrency_slot
+from recipes.images import get_image_storage
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+MARGIN = 50
+IMAGE_SIZE = (300, 220)
+LINE_SPACING = 1.4
+TITLE_SIZE = 20
+HEADING_SIZE = 14
+TEXT_SIZE = 11
+
+_pool = None
+_pool_users = 0
+_pool_timer = None
+_pool_lock = threading.Lock()
+
+
+@contextmanager
+def use_pool():
+    """Пул процессов для подготовки страниц, общий для сборок воркера.
+
+    Процессы запускаются через spawn: воркер gunicorn к этому времени уже
+    может держать потоки и соединения, которые нельзя копировать fork.
+    Пул создаётся первой сборкой и останавливается, если
+    COOKBOOK_POOL_IDLE_TIMEOUT секунд он не нужен ни одной сборке.
+    """
+    global _pool, _pool_users, _pool_timer
+    with _pool_lock:
+        if _pool_timer is not None:
+            _pool_timer.cancel()
+            _pool_timer = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                settings.COOKBOOK_PROCESSES, mp_context=get_context('spawn'),
+                initializer=django.setup)
+        _pool_users += 1
+        pool = _pool
+    try:
+        yield pool
+    except BrokenProcessPool:
+        discard_pool(pool)
+        raise
+    finally:
+        with _pool_lock:
+            _pool_users -= 1
+            if _pool_users == 0 and _pool is not None:
+                _pool_timer = threading.Timer(
+                    settings.COOKBOOK_POOL_IDLE_TIMEOUT, shutdown_idle_pool)
+                _pool_timer.daemon = True
+                _pool_timer.start()
+
+
+def discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_idle_pool():
+    global _pool
+    with _pool_lock:
+        # Таймер мог сработать, когда новая сборка уже взяла пул.
+        if _pool_users or _pool is None:
+            return
+        pool, _pool = _pool, None
+    pool.shutdown(wait=False)
+
+
+def get_favorites(user):
+    """Карточки и изображения избранных рецептов и версия книги.
+
+    Версия меняется при любом изменении избранного или выводимых в книгу
+    данных рецептов, потому что карточки обновляются вместе с рецептами.
+    """
+    rows = list(Recipe.objects.filter(favorite_list__user=user).order_by(
+        'name', 'id').values_list('id', 'card', 'image'))
+    built = build_cards([id for id, card, _ in rows if card is None])
+    recipes = [(card or built[id], image) for id, card, image in rows
+               if card or id in built]
+    version = hashlib.sha1(json.dumps(
+        recipes, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    return recipes, version[:16]
+
+
+def get_cookbook_path(user_id, version):
+    return settings.COOKBOOK_DIR / f'{user_id}-{version}.pdf'
+
+
+def layout_recipe(card, image_path):
+    """Страница рецепта без PDF: уменьшенное изображение и строки текста.
+
+    Выполняется в пуле процессов: декодирование изображений и разбиение
+    текста на строки — самая долгая часть выгрузки.
+    """
+    from PIL import Image
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import simpleSplit
+
+    from api.views import PDF_FONT, register_pdf_font
+
+    register_pdf_font()
+    width = A4[0] - 2 * MARGIN
+    blocks = []
+
+    def add_text(text, size):
+        for paragraph in text.splitlines() or ['']:
+            for line in simpleSplit(paragraph, PDF_FONT, size, width) or ['']:
+                blocks.append(('text', size, line))
+
+    add_text(card['name'], TITLE_SIZE)
+    if image_path is not None:
+        try:
+            with Image.open(image_path) as image:
+                image = image.convert('RGB')
+                # Двойное разрешение, чтобы изображение не было мутным
+                # при печати.
+                image.thumbnail((IMAGE_SIZE[0] * 2, IMAGE_SIZE[1] * 2))
+                content = io.BytesIO()
+                image.save(content, 'JPEG', quality=85)
+                blocks.append(('image', content.getvalue(),
+                               image.width / 2, image.height / 2))
+        except OSError:
+            pass
+    add_text(f'Время приготовления: {card["cooking_time"]} мин.', TEXT_SIZE)
+    add_text('Ингредиенты', HEADING_SIZE)
+    for ingredient in card['ingredients']:
+        add_text(f'{ingredient["name"]} – {ingredient["amount"]} '
+                 f'{ingredient["measurement_unit"]}', TEXT_SIZE)
+    add_text('Приготовление', HEADING_SIZE)
+    add_text(card['text'], TEXT_SIZE)
+    return blocks
+
+
+def write_cookbook(pages, path):
+    """Собирает подготовленные страницы в один PDF.
+
+    Изображения уже сжаты в JPEG и вставляются без перекодирования.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    from api.views import PDF_FONT, register_pdf_font
+
+    register_pdf_font()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    pdf = canvas.Canvas(str(temporary_path), pagesize=A4)
+    for blocks in pages:
+        top = A4[1] - MARGIN
+        for block in blocks:
+            height = (block[3] if block[0] == 'image'
+                      else block[1] * LINE_SPACING)
+            if top - height < MARGIN:
+                pdf.showPage()
+                top = A4[1] - MARGIN
+            top -= height
+            if block[0] == 'image':
+                _, content, width, _ = block
+                pdf.drawImage(ImageReader(io.BytesIO(content)), MARGIN, top,
+                              width, height)
+                top -= TEXT_SIZE
+            else:
+                _, size, line = block
+                pdf.setFont(PDF_FONT, size)
+                pdf.drawString(MARGIN, top, line)
+        pdf.showPage()
+    pdf.save()
+    os.replace(temporary_path, path)
+
+
+@contextmanager
+def heartbeat(leases):
+    """Продлевает записи leases, пока идёт сборка.
+
+    leases — список пар (кэш, ключ), его можно дополнять внутри блока.
+    Записи продлеваются на COOKBOOK_HEARTBEAT_TIMEOUT каждую треть этого
+    времени, но не дольше COOKBOOK_RENDER_TIMEOUT: зависшая сборка
+    перестаёт считаться живой.
+    """
+    stop = threading.Event()
+    deadline = time.monotonic() + settings.COOKBOOK_RENDER_TIMEOUT
+    timeout = settings.COOKBOOK_HEARTBEAT_TIMEOUT
+
+    def beat():
+        while not stop.wait(timeout / 3) and time.monotonic() < deadline:
+            for lease_cache, key in list(leases):
+                try:
+                    lease_cache.touch(key, timeout)
+                except Exception:
+                    logger.exception('Не удалось продлить отметку сборки')
+
+    threading.Thread(target=beat, daemon=True).start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+def export_cookbook(key, owner, user_id, version, recipes):
+    storage, _ = get_image_storage()
+    image_paths = [storage.path(image) if image else None
+                   for _, image in recipes]
+    leases = [(cache, key)]
+    try:
+        with heartbeat(leases), concurrency_slot(
+                'cookbook', settings.COOKBOOK_MAX_EXPORTS, owner,
+                settings.COOKBOOK_HEARTBEAT_TIMEOUT) as slot:
+            leases.append((caches['throttle'], slot))
+            with use_pool() as pool:
+                pages = pool.map(
+                    layout_recipe, [card for card, _ in recipes], image_paths)
+                path = get_cookbook_path(user_id, version)
+                write_cookbook(pages, path)
+        for old_path in path.parent.glob(f'{user_id}-*.pdf'):
+            if old_path != path:
+                old_path.unlink(missing_ok=True)
+    except Throttled:
+        # Без отметки о сборке следующий опрос клиента запустит её снова.
+        pass
+    except BrokenProcessPool:
+        logger.exception('Пул процессов книги рецептов остановился')
+    except Exception:
+        logger.exception('Не удалось собрать книгу рецептов')
+    finally:
+        marker = cache.get(key)
+        if marker is not None and marker['owner'] == owner:
+            cache.delete(key)
+
+
+def start_export(user_id, version, recipes):
+    """Запускает сборку книги в фоне, если она ещё не собирается.
+
+    Отметка о сборке в общем кэше с хостом и pid владельца не даёт
+    запустить её повторно из другого воркера. Владелец продлевает её,
+    пока собирает книгу, и снимает по окончании. Отметка остановленного
+    воркера истекает через COOKBOOK_HEARTBEAT_TIMEOUT, и следующий опрос
+    клиента запускает сборку заново.
+    """
+    key = f'cookbook_{user_id}_{version}'
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    marker = {'owner': owner, 'started': time.time()}
+    if not cache.add(key, marker, settings.COOKBOOK_HEARTBEAT_TIMEOUT):
+        return
+    threading.Thread(target=export_cookbook,
+                     args=(key, owner, user_id, version, recipes),
+                     daemon=True).start()
@@ -0,0 +1,79 @@
+from rest_framework.exceptions import ValidationError
+
+
+def parse_list(request, name):
+    """Значения параметра name через запятую или None, если их нет."""
+    if request is None:
+        return None
+    values = {
+        value.strip()
+        for param in request.query_params.getlist(name)
+        for value in param.split(',') if value.strip()
+    }
+    return values or None
+
+
+class FieldSelection:
+    """Поля и связи, запрошенные параметрами ?fields= и ?expand=.
+
+    Без параметров выбираются все поля и раскрываются все связи. Если
+    задан хотя бы один параметр, связи вне expand отдаются компактно —
+    идентификаторами.
+    """
+    def __init__(self, request, fields, relations=()):
+        requested = parse_list(request, 'fields')
+        expand = parse_list(request, 'expand')
+        unknown = ((requested or set()) - set(fields)
+                   | (expand or set()) - set(relations))
+        if unknown:
+            raise ValidationError(
+                {'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}'})
+        if requested is None:
+            self.fields = tuple(fields)
+        else:
+            self.fields = tuple(
+                field for field in fields if field in requested)
+        self.default = requested is None and expand is None
+        if self.default:
+            self.expand = frozenset(relations)
+        else:
+            self.expand = frozenset(expand or ())
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def expanded(self, relation):
+        return relation in self.fields and relation in self.expand
+
+
+def only_selected(queryset, selection):
+    """Загружает из таблицы только столбцы выбранных полей."""
+    columns = {field.name for field in queryset.model._meta.concrete_fields}
+    return queryset.only(
+        'pk', *(field for field in selection.fields if field in columns))
+
+
+class SparseFieldsMixin:
+    """Оставляет в сериализаторе только запрошенные поля.
+
+    Действует на сериализатор, созданный с контекстом запроса; вложенные
+    сериализаторы полей не меняются. compact_fields — фабрики компактных
+    полей для связей, которые не раскрыты в ?expand=.
+    """
+    compact_fields = {}
+
+    @classmethod
+    def get_selection(cls, request):
+        return FieldSelection(request, cls.Meta.fields, cls.compact_fields)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        selection = self.get_selection(request)
+        for name in set(self.fields) - set(selection.fields):
+            self.fields.pop(name)
+        for name, compact_field in self.compact_fields.items():
+            if name in self.fields and not selection.expanded(name):
+                self.fields[name] = compact_field()
@@ -1,7 +1,7 @@
-from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Q
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Ingredient, Recipe, Tag
 
 
 class IngredientFilter(FilterSet):
@@ -29,10 +29,14 @@ class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Популярные'), ('trending', 'Набирающие')),
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'ordering')
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -43,3 +47,26 @@ class RecipeFilter(FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shopping_list__user=self.request.user)
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        # Рейтинги заранее считает команда update_rankings; рецепты без
+        # рейтинга идут в конце, как и в обычном списке, по дате.
+        return queryset.order_by(
+            F(f'ranking__{value}').desc(nulls_last=True), '-pub_date', '-id')
+
+
+def get_tag_facets(request, queryset):
+    """Число рецептов с каждым тегом при остальных фильтрах запроса.
+
+    Фильтр по тегам не учитывается: для каждого тега это число рецептов,
+    которое будет в списке, если выбрать только его. Считается одним
+    запросом с группировкой по тегам.
+    """
+    filterset = RecipeFilter(request.query_params, queryset, request=request)
+    # Без фильтра tags форма не загружает из базы список его значений.
+    for name in ('tags', 'ordering'):
+        del filterset.filters[name]
+    recipes = filterset.qs
+    return list(Tag.objects.annotate(
+        count=Count('recipes', filter=Q(recipes__in=recipes.values('pk')))
+    ).values('id', 'slug', 'count').order_by('id'))
@@ -0,0 +1,124 @@
+import multiprocessing
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import BaseCommand
+
+from foodgram.cache import SQLiteCache
+
+
+def make_cache(backend, location, max_entries):
+    params = {'OPTIONS': {'MAX_ENTRIES': max_entries}}
+    if backend == 'locmem':
+        return LocMemCache(location, params)
+    return SQLiteCache(location, params)
+
+
+def run_worker(seed, backend, location, keys, rounds, value_size,
+               compute_time):
+    """Запросы одного воркера: get, а при промахе — «расчёт» и set.
+
+    Воркеры читают ключи в разном порядке, как запросы разных клиентов.
+    """
+    cache = make_cache(backend, location, keys * 2)
+    value = b'x' * value_size
+    numbers = list(range(keys))
+    random.Random(seed).shuffle(numbers)
+    misses = 0
+    for _ in range(rounds):
+        for number in numbers:
+            if cache.get(f'key:{number}') is None:
+                misses += 1
+                time.sleep(compute_time)
+                cache.set(f'key:{number}', value)
+    return misses
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает общий кэш SQLiteCache с LocMemCache: скорость '
+            'операций в одном процессе и долю промахов при нескольких '
+            'воркерах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=10000)
+        parser.add_argument('--value-size', type=int, default=1024,
+                            help='Размер значения в байтах.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--keys', type=int, default=200,
+                            help='Число ключей, которые читают воркеры.')
+        parser.add_argument('--compute-time', type=float, default=0.001,
+                            help='Время «расчёта» значения при промахе, с.')
+
+    def measure(self, name, operation, count):
+        start = time.perf_counter()
+        operation()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{name:16} {count / elapsed:12.0f} оп/с '
+            f'{elapsed * 1e6 / count:8.1f} мкс')
+
+    def bench_operations(self, cache, operations, value_size):
+        value = b'x' * value_size
+        keys = [f'key:{number}' for number in range(operations)]
+        batches = [keys[start:start + 100]
+                   for start in range(0, operations, 100)]
+
+        def set_all():
+            for key in keys:
+                cache.set(key, value)
+
+        def get_all():
+            for key in keys:
+                cache.get(key)
+
+        def get_missing():
+            for key in keys:
+                cache.get(f'missing:{key}')
+
+        def get_many():
+            for batch in batches:
+                cache.get_many(batch)
+
+        def incr():
+            cache.set('counter', 0)
+            for _ in keys:
+                cache.incr('counter')
+
+        self.measure('set', set_all, operations)
+        self.measure('get', get_all, operations)
+        self.measure('get (промах)', get_missing, operations)
+        self.measure('get_many по 100', get_many, operations)
+        self.measure('incr', incr, operations)
+
+    def bench_workers(self, backend, location, options):
+        context = multiprocessing.get_context('fork')
+        rounds = 5
+        start = time.perf_counter()
+        with context.Pool(options['workers']) as pool:
+            misses = pool.starmap(run_worker, [
+                (seed, backend, location, options['keys'], rounds,
+                 options['value_size'], options['compute_time'])
+                for seed in range(options['workers'])
+            ])
+        elapsed = time.perf_counter() - start
+        requests = options['keys'] * rounds * options['workers']
+        self.stdout.write(
+            f'{options["workers"]} воркеров: промахов {sum(misses)} '
+            f'из {requests} ({sum(misses) / requests:.1%}), '
+            f'{elapsed:.2f} с')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for backend, location in (
+                    ('locmem', 'bench'),
+                    ('sqlite', str(Path(directory) / 'bench.sqlite3'))):
+                self.stdout.write(self.style.MIGRATE_HEADING(backend))
+                cache = make_cache(
+                    backend, location, options['operations'] * 2)
+                self.bench_operations(
+                    cache, options['operations'], options['value_size'])
+                cache.clear()
+                self.bench_workers(backend, location, options)
@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.representations import (recipe_rows, represent_recipes,
+                                 select_recipe_fields)
+from api.serializers import GetRecipeSerializer
+from recipes.models import Recipe
+from users.models import User
+
+
+def get_allowed_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость сериализации списка рецептов '
+            'через DRF и через быстрое представление, а с --fields '
+            'и --expand — ещё размер и скорость выбранных полей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Количество рецептов на странице.')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Количество повторов каждого варианта.')
+        parser.add_argument('--user', help='Email пользователя запроса.')
+        parser.add_argument('--fields', help='Значение параметра ?fields=.')
+        parser.add_argument('--expand', help='Значение параметра ?expand=.')
+        parser.add_argument('--host', default=get_allowed_host(),
+                            help='Хост запроса, по умолчанию первый из '
+                                 'ALLOWED_HOSTS.')
+
+    def make_request(self, email, params=None):
+        # Хост запроса должен быть в ALLOWED_HOSTS: по нему строятся
+        # абсолютные ссылки на изображения.
+        request = APIRequestFactory().get(
+            '/api/recipes/', params or {}, HTTP_HOST=self.host)
+        if email:
+            try:
+                force_authenticate(request, User.objects.get(email=email))
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {email} не найден')
+        return Request(request)
+
+    def measure(self, render, repeat):
+        content = render()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return content, time.perf_counter() - start
+
+    def compare(self, request, queryset, repeat):
+        """Замеряет оба способа представления и сверяет их ответы."""
+        renderer = JSONRenderer()
+        selection = GetRecipeSerializer.get_selection(request)
+
+        def drf():
+            serializer = GetRecipeSerializer(
+                select_recipe_fields(queryset.all(), selection), many=True,
+                context={'request': request})
+            return renderer.render(serializer.data)
+
+        def fast():
+            rows = recipe_rows(queryset.all(), selection)
+            return renderer.render(
+                represent_recipes(rows, request, selection))
+
+        drf_content, drf_time = self.measure(drf, repeat)
+        fast_content, fast_time = self.measure(fast, repeat)
+        rows = len(queryset) * repeat
+        for name, elapsed in (('DRF', drf_time), ('fast', fast_time)):
+            self.stdout.write(
+                f'{name}: {rows / elapsed:.0f} строк/с ({elapsed:.3f} с)')
+        if drf_content != fast_content:
+            raise CommandError('Ответы сериализаторов различаются')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ответы совпадают, ускорение в {drf_time / fast_time:.1f} раза'))
+        return len(fast_content), fast_time
+
+    def handle(self, *args, **options):
+        self.host = options['host']
+        queryset = Recipe.objects.all()[:options['limit']]
+        self.stdout.write(self.style.MIGRATE_HEADING('Все поля'))
+        size, elapsed = self.compare(
+            self.make_request(options['user']), queryset, options['repeat'])
+        if options['fields'] is None and options['expand'] is None:
+            return
+
+        params = {name: options[name] for name in ('fields', 'expand')
+                  if options[name] is not None}
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Выбранные поля: {params}'))
+        sparse_size, sparse_elapsed = self.compare(
+            self.make_request(options['user'], params), queryset,
+            options['repeat'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ответ: {size} -> {sparse_size} байт '
+            f'({sparse_size / size:.0%}), время: {elapsed:.3f} -> '
+            f'{sparse_elapsed:.3f} с ({sparse_elapsed / elapsed:.0%})'))
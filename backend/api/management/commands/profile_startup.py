@@ -0,0 +1,65 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+STARTUP_SCRIPT = '''
+import django
+from django.conf import settings
+from django.urls import get_resolver
+from django.utils.module_loading import import_string
+
+django.setup()
+import_string(settings.WSGI_APPLICATION)
+get_resolver().url_patterns
+'''
+
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = ('Запускает приложение в отдельном процессе с -X importtime '
+            'и показывает самые медленные при импорте модули.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument('--sort', choices=('cumulative', 'self'),
+                            default='cumulative')
+        parser.add_argument('--top-level', action='store_true',
+                            help='Только пакеты верхнего уровня.')
+
+    def handle(self, *args, **options):
+        env = {**os.environ,
+               'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode:
+            raise CommandError(result.stderr)
+
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME.match(line)
+            if match is None:
+                continue
+            own, cumulative, indent, name = match.groups()
+            if options['top_level'] and indent:
+                continue
+            modules.append((int(own), int(cumulative), name))
+        column = 1 if options['sort'] == 'cumulative' else 0
+        modules.sort(key=lambda module: module[column], reverse=True)
+
+        self.stdout.write(
+            f'{"собственное, мс":>16} {"с зависимостями, мс":>20}  модуль')
+        for own, cumulative, name in modules[:options['limit']]:
+            self.stdout.write(
+                f'{own / 1000:16.1f} {cumulative / 1000:20.1f}  {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Модулей загружено: {len(modules)}, запуск процесса занял '
+            f'{elapsed:.2f} с'))
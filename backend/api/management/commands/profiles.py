@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from django.core.management import BaseCommand, CommandError
+
+from foodgram.profiling import list_profiles, load_profile, sign_profile_header
+
+
+class Command(BaseCommand):
+    help = ('Показывает профили запросов, снятые ProfilingMiddleware, '
+            'и подписывает заголовок X-Profile.')
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='subcommand')
+        subcommands.add_parser('list', help='Список сохранённых профилей.')
+        show = subcommands.add_parser('show', help='Содержимое профиля.')
+        show.add_argument('profile_id')
+        show.add_argument('--limit', type=int, default=25)
+        show.add_argument('--sort', choices=('cumulative', 'own'),
+                          default='cumulative')
+        subcommands.add_parser(
+            'sign', help='Подписанное значение заголовка X-Profile.')
+
+    def handle(self, *args, **options):
+        subcommand = options['subcommand'] or 'list'
+        if subcommand == 'sign':
+            self.stdout.write(sign_profile_header())
+        elif subcommand == 'show':
+            self.show(options)
+        else:
+            self.list()
+
+    def list(self):
+        for path in reversed(list_profiles()):
+            profile = load_profile(path.stem)
+            started = datetime.fromtimestamp(profile['started'])
+            self.stdout.write(
+                f'{profile["id"]}  {started:%Y-%m-%d %H:%M:%S}  '
+                f'{profile["duration"] * 1000:8.1f} мс  '
+                f'{len(profile["queries"]):4} SQL  {profile["status"]}  '
+                f'{profile["method"]} {profile["path"]}')
+
+    def show(self, options):
+        try:
+            profile = load_profile(options['profile_id'])
+        except FileNotFoundError:
+            raise CommandError(f'Профиль {options["profile_id"]} не найден')
+        self.stdout.write(
+            f'{profile["method"]} {profile["path"]} -> {profile["status"]}, '
+            f'{profile["duration"] * 1000:.1f} мс, из них SQL '
+            f'{profile["sql_time"] * 1000:.1f} мс '
+            f'({len(profile["queries"])} запросов)')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Функции'))
+        self.stdout.write(
+            f'{"вызовы":>8} {"своё, мс":>10} {"всего, мс":>10}  функция')
+        functions = sorted(profile['functions'],
+                           key=lambda row: row[options['sort']],
+                           reverse=True)
+        for row in functions[:options['limit']]:
+            self.stdout.write(
+                f'{row["calls"]:8} {row["own"] * 1000:10.2f} '
+                f'{row["cumulative"] * 1000:10.2f}  {row["function"]}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('SQL'))
+        for query in profile['queries']:
+            self.stdout.write(
+                f'{query["time"] * 1000:8.2f} мс  [{query["alias"]}] '
+                f'{query["sql"]}')
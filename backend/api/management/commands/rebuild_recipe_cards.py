@@ -0,0 +1,33 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api.cards import refresh_cards
+from foodgram.response_cache import bump_generation
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает сохранённые карточки рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--missing', action='store_true',
+                            help='Только рецепты без карточки.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('id')
+        if options['missing']:
+            recipes = recipes.filter(card__isnull=True)
+        start = time.perf_counter()
+        done = last_id = 0
+        while recipe_ids := list(recipes.filter(id__gt=last_id).values_list(
+                'id', flat=True)[:options['batch_size']]):
+            refresh_cards(recipe_ids, options['batch_size'],
+                          record_changes=False)
+            done += len(recipe_ids)
+            last_id = recipe_ids[-1]
+        bump_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Карточек перестроено: {done} за '
+            f'{time.perf_counter() - start:.1f} с'))
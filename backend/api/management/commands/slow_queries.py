@@ -0,0 +1,81 @@
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from foodgram.slow_queries import read_entries
+
+
+class Command(BaseCommand):
+    help = ('Сводка журнала медленных запросов SlowQueryMiddleware '
+            'по отпечаткам запросов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('fingerprint', nargs='?',
+                            help='Подробности об одном отпечатке.')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--sort', default='total',
+                            choices=('total', 'count', 'avg', 'max'))
+        parser.add_argument('--clear', action='store_true',
+                            help='Очистить журнал.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            for path in (Path(settings.SLOW_QUERY_LOG),
+                         Path(f'{settings.SLOW_QUERY_LOG}.1')):
+                path.unlink(missing_ok=True)
+            return
+
+        stats = {}
+        for entry in read_entries():
+            stat = stats.setdefault(entry['fingerprint'], {
+                'sql': entry['sql'],
+                'count': 0,
+                'total': 0,
+                'max': 0,
+                'plan': None,
+                'views': Counter(),
+                'sites': Counter(),
+            })
+            stat['count'] += 1
+            stat['total'] += entry['time']
+            stat['max'] = max(stat['max'], entry['time'])
+            stat['plan'] = stat['plan'] or entry['plan']
+            stat['views'][entry['view']] += 1
+            stat['sites'][' / '.join(
+                filter(None, (entry['serializer'], entry['code'])))] += 1
+        for stat in stats.values():
+            stat['avg'] = stat['total'] / stat['count']
+
+        if options['fingerprint']:
+            if options['fingerprint'] not in stats:
+                raise CommandError(
+                    f'Отпечаток {options["fingerprint"]} не найден')
+            self.show(options['fingerprint'], stats[options['fingerprint']])
+            return
+
+        self.stdout.write(
+            f'{"отпечаток":12} {"раз":>6} {"всего, мс":>10} '
+            f'{"средн., мс":>10} {"макс., мс":>10}  запрос')
+        ordered = sorted(stats.items(), key=lambda item: item[1][
+            options['sort']], reverse=True)
+        for key, stat in ordered[:options['limit']]:
+            self.stdout.write(
+                f'{key:12} {stat["count"]:6} {stat["total"]:10.1f} '
+                f'{stat["avg"]:10.1f} {stat["max"]:10.1f}  '
+                f'{stat["sql"][:100]}')
+
+    def show(self, key, stat):
+        self.stdout.write(
+            f'{key}: {stat["count"]} раз, всего {stat["total"]:.1f} мс, '
+            f'в среднем {stat["avg"]:.1f} мс, максимум {stat["max"]:.1f} мс')
+        self.stdout.write(stat['sql'])
+        self.stdout.write(self.style.MIGRATE_HEADING('Представления'))
+        for view, count in stat['views'].most_common():
+            self.stdout.write(f'{count:6}  {view}')
+        self.stdout.write(self.style.MIGRATE_HEADING('Места вызова'))
+        for site, count in stat['sites'].most_common():
+            self.stdout.write(f'{count:6}  {site}')
+        self.stdout.write(self.style.MIGRATE_HEADING('План'))
+        self.stdout.write(stat['plan'] or 'не получен')
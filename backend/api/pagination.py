@@ -1,5 +1,18 @@
+from django.conf import settings
 from rest_framework.pagination import PageNumberPagination
 
 
 class LimitPagination(PageNumberPagination):
+    """Пагинация с размером страницы из параметра limit.
+
+    Размер ограничен MAX_PAGE_SIZE или значением для действия из словаря
+    view.max_page_sizes вида {action: size}.
+    """
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        view = request.parser_context.get('view')
+        self.max_page_size = getattr(view, 'max_page_sizes', {}).get(
+            getattr(view, 'action', None), settings.MAX_PAGE_SIZE)
+        return super().get_page_size(request)
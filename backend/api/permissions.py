@@ -6,4 +6,4 @@ class IsAuthorOrReadOnly(BasePermission):
         return request.user.is_authenticated or request.method in SAFE_METHODS
 
     def has_object_permission(self, request, view, obj):
-        return obj.author == request.user or request.method in SAFE_METHODS
+        return request.method in SAFE_METHODS or obj.author == request.user
@@ -0,0 +1,44 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def to_line(item):
+    return json.dumps(item, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """JSON по объекту на строку: ?format=ndjson или Accept."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(to_line(item) for item in data).encode()
+
+
+def stream_ndjson(queryset, represent, chunk_size=None):
+    """Отдаёт queryset построчно, представляя его пачками по chunk_size.
+
+    Одновременно в памяти находится только одна пачка, поэтому потребление
+    памяти не зависит от размера выборки. База выбирается сразу: строки
+    читаются уже после выхода из представления.
+    """
+    chunk_size = chunk_size or settings.NDJSON_CHUNK_SIZE
+    queryset = queryset.using(queryset.db)
+
+    def lines():
+        rows = queryset.iterator(chunk_size=chunk_size)
+        while chunk := list(islice(rows, chunk_size)):
+            yield ''.join(to_line(item) for item in represent(chunk))
+
+    return StreamingHttpResponse(lines(),
+                                 content_type=NDJSONRenderer.media_type)
@@ -0,0 +1,231 @@
+from collections import defaultdict
+
+from api.fieldsets import only_selected
+from recipes.models import Favorite, Recipe, RecipeIngredient, Shopping
+from users.models import User
+
+RECIPE_FIELDS = ('id', 'name', 'image', 'text', 'cooking_time', 'author_id')
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+def recipe_rows(queryset, selection=None):
+    """Строки рецептов для быстрого представления.
+
+    С selection загружаются только столбцы выбранных полей.
+    """
+    if selection is None or selection.default:
+        return queryset.values('id', 'card')
+    columns = {'author': 'author_id', **{
+        field: field for field in RECIPE_FIELDS if field != 'author_id'}}
+    return queryset.values('id', *(
+        columns[field] for field in selection.fields
+        if field in columns and field != 'id'))
+
+
+def select_recipe_fields(queryset, selection):
+    """Queryset рецептов без невыбранных столбцов и связей."""
+    queryset = only_selected(queryset, selection)
+    if selection.expanded('author'):
+        queryset = queryset.select_related('author')
+    if 'tags' in selection:
+        queryset = queryset.prefetch_related('tags')
+    if selection.expanded('ingredients'):
+        queryset = queryset.prefetch_related('recipe_ingredient__ingredient')
+    elif 'ingredients' in selection:
+        queryset = queryset.prefetch_related('recipe_ingredient')
+    return queryset
+
+
+def get_tags(recipe_ids, compact=False):
+    tags = defaultdict(list)
+    if compact:
+        rows = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag_id').order_by('pk')
+        for recipe_id, tag_id in rows:
+            tags[recipe_id].append(tag_id)
+        return tags
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list(
+        'recipe_id', 'tag__id', 'tag__name', 'tag__color', 'tag__slug'
+    ).order_by('pk')
+    for recipe_id, id, name, color, slug in rows:
+        tags[recipe_id].append(
+            {'id': id, 'name': name, 'color': color, 'slug': slug}
+        )
+    return tags
+
+
+def get_ingredients(recipe_ids, compact=False):
+    ingredients = defaultdict(list)
+    if compact:
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id', 'amount').order_by('pk')
+        for recipe_id, id, amount in rows:
+            ingredients[recipe_id].append({'id': id, 'amount': amount})
+        return ingredients
+    rows = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list(
+        'recipe_id', 'ingredient__id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ).order_by('pk')
+    for recipe_id, id, name, measurement_unit, amount in rows:
+        ingredients[recipe_id].append({
+            'id': id,
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': amount,
+        })
+    return ingredients
+
+
+def get_image_url(name, request):
+    if not name:
+        return None
+    return get_absolute_url(
+        Recipe._meta.get_field('image').storage.url(name), request)
+
+
+def get_absolute_url(url, request):
+    if url is not None and request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def build_cards(recipe_ids):
+    """Карточки рецептов: общая для всех пользователей часть представления.
+
+    Ссылка на изображение хранится без домена, он добавляется по запросу.
+    """
+    rows = list(Recipe.objects.filter(id__in=recipe_ids).values(
+        *RECIPE_FIELDS))
+    ids = [row['id'] for row in rows]
+    tags = get_tags(ids)
+    ingredients = get_ingredients(ids)
+    authors = {
+        author['id']: author for author in User.objects.filter(
+            id__in={row['author_id'] for row in rows}
+        ).values(*AUTHOR_FIELDS)
+    }
+    return {
+        row['id']: {
+            'tags': tags[row['id']],
+            'author': authors.get(row['author_id']),
+            'ingredients': ingredients[row['id']],
+            'name': row['name'],
+            'image': get_image_url(row['image'], None),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+        for row in rows
+    }
+
+
+def represent_recipes(rows, request, selection=None):
+    """Представление рецептов без сериализаторов DRF.
+
+    Повторяет вывод GetRecipeSerializer, но собирает его из нескольких
+    запросов .values() на всю страницу вместо вложенных сериализаторов.
+    С selection выводятся и запрашиваются только выбранные поля.
+    """
+    rows = list(rows)
+    if selection is None or selection.default:
+        return represent_full(rows, request)
+
+    recipe_ids = [row['id'] for row in rows]
+    fields = selection.fields
+    values = {
+        'name': lambda row: row['name'],
+        'image': lambda row: get_image_url(row['image'], request),
+        'text': lambda row: row['text'],
+        'cooking_time': lambda row: row['cooking_time'],
+    }
+    if 'tags' in fields:
+        tags = get_tags(recipe_ids, not selection.expanded('tags'))
+        values['tags'] = lambda row: tags[row['id']]
+    if 'ingredients' in fields:
+        ingredients = get_ingredients(
+            recipe_ids, not selection.expanded('ingredients'))
+        values['ingredients'] = lambda row: ingredients[row['id']]
+    if selection.expanded('author'):
+        authors = get_authors(rows, request)
+        values['author'] = lambda row: authors.get(row['author_id'])
+    else:
+        values['author'] = lambda row: row['author_id']
+    user = request.user
+    for field, model in (('is_favorited', Favorite),
+                         ('is_in_shopping_cart', Shopping)):
+        if field in fields:
+            marked = get_marked(model, user, recipe_ids)
+            values[field] = lambda row, marked=marked: row['id'] in marked
+
+    data = []
+    for row in rows:
+        data.append({
+            field: row['id'] if field == 'id' else values[field](row)
+            for field in fields
+        })
+    return data
+
+
+def get_authors(rows, request):
+    authors = User.objects.filter(
+        id__in={row['author_id'] for row in rows}
+    ).values(*AUTHOR_FIELDS)
+    user = request.user
+    # Та же проверка, что и в CustomUserSerializer.get_is_subscribed.
+    is_subscribed = user.is_authenticated and user.following.exists()
+    return {
+        author['id']: {**author, 'is_subscribed': is_subscribed}
+        for author in authors
+    }
+
+
+def get_marked(model, user, recipe_ids):
+    if not user.is_authenticated:
+        return frozenset()
+    return frozenset(model.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+
+
+def represent_full(rows, request):
+    """Представление из сохранённых карточек и отметок пользователя.
+
+    Карточки, которых ещё нет, строятся на лету, но не сохраняются: запрос
+    на чтение может идти к реплике.
+    """
+    recipe_ids = [row['id'] for row in rows]
+    built = build_cards(
+        [row['id'] for row in rows if row['card'] is None])
+    user = request.user
+    # Та же проверка, что и в CustomUserSerializer.get_is_subscribed.
+    is_subscribed = user.is_authenticated and user.following.exists()
+    favorited = get_marked(Favorite, user, recipe_ids)
+    in_shopping_cart = get_marked(Shopping, user, recipe_ids)
+
+    data = []
+    for row in rows:
+        recipe_id = row['id']
+        card = row['card'] or built.get(recipe_id)
+        if card is None:
+            continue
+        author = card['author']
+        if author is not None:
+            author = {**author, 'is_subscribed': is_subscribed}
+        data.append({
+            'id': recipe_id,
+            'tags': card['tags'],
+            'author': author,
+            'ingredients': card['ingredients'],
+            'is_favorited': recipe_id in favorited,
+            'is_in_shopping_cart': recipe_id in in_shopping_cart,
+            'name': card['name'],
+            'image': get_absolute_url(card['image'], request),
+            'text': card['text'],
+            'cooking_time': card['cooking_time'],
+        })
+    return data
@@ -1,28 +1,55 @@
 import base64
+import json
+import re
+import uuid
+from urllib.parse import urlparse
 
 from django.core.files.base import ContentFile
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
+from rest_framework.utils import html
 
+from api.cards import deferred_refresh
+from api.fieldsets import SparseFieldsMixin
 from users.models import User
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            Shopping, Tag)
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import recipe_contents_changed
+
+
+INGREDIENT_FORM_FIELD = re.compile(r'^ingredients\[(\d+)\]\[?(\w+)\]?$')
 
 
 class Base64ImageField(serializers.ImageField):
-    """Кодирование изображения в base64."""
+    """Кодирование изображения в base64.
+
+    Ссылка на текущее изображение объекта вместо base64 оставляет его без
+    изменений, не декодируя и не записывая файл заново. Файл, загруженный
+    через multipart/form-data, принимается как есть.
+    """
+    def get_current_file(self, data):
+        instance = getattr(self.parent, 'instance', None)
+        current = instance and getattr(instance, self.source)
+        if current and urlparse(data).path == urlparse(current.url).path:
+            return current
+        return None
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='photo.' + ext)
+            data = ContentFile(base64.b64decode(imgstr),
+                               name=f'{uuid.uuid4().hex}.{ext}')
+        elif isinstance(data, str):
+            current = self.get_current_file(data)
+            if current is not None:
+                return current
         return super().to_internal_value(data)
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SparseFieldsMixin, UserSerializer):
     """Отображение информации о пользователе."""
     is_subscribed = SerializerMethodField(read_only=True)
 
@@ -67,6 +94,15 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class CompactRecipeIngredientSerializer(serializers.ModelSerializer):
+    """Ингредиент в рецепте без названия и единицы измерения."""
+    id = serializers.IntegerField(source='ingredient_id', read_only=True)
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'amount')
+
+
 class AddIngredientSerializer(serializers.ModelSerializer):
     """Добавление ингредиента при создании рецепта."""
     id = serializers.PrimaryKeyRelatedField(
@@ -101,6 +137,42 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'tags', 'author', 'ingredients',
                   'name', 'image', 'text', 'cooking_time')
 
+    def to_internal_value(self, data):
+        if html.is_html_input(data):
+            data = self.parse_form(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_form(data):
+        """Данные multipart/form-data в том же виде, что и в JSON.
+
+        Теги передаются повторяющимся полем tags, ингредиенты — полями
+        ingredients[0][id], ingredients[0][amount] и т. д. или одним полем
+        ingredients со списком в JSON. Изображение — файлом, который
+        Django при загрузке пишет во временный файл, а не держит в памяти.
+        """
+        result = {}
+        ingredients = {}
+        for key in data:
+            match = INGREDIENT_FORM_FIELD.match(key)
+            if match:
+                index, name = match.groups()
+                ingredients.setdefault(int(index), {})[name] = data[key]
+            elif key == 'tags':
+                result[key] = data.getlist(key)
+            else:
+                result[key] = data[key]
+        if ingredients:
+            result['ingredients'] = [
+                ingredients[index] for index in sorted(ingredients)]
+        elif isinstance(result.get('ingredients'), str):
+            try:
+                result['ingredients'] = json.loads(result['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {'ingredients': 'Ожидается список ингредиентов в JSON'})
+        return result
+
     def create_ingredients(self, recipe, ingredients):
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
@@ -109,30 +181,36 @@ class RecipeSerializer(serializers.ModelSerializer):
                 amount=ingredient.get('amount')
             ) for ingredient in ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(author=user,
-                                       **validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+        with deferred_refresh():
+            recipe = Recipe.objects.create(author=user,
+                                           **validated_data)
+            recipe.tags.set(tags)
+            self.create_ingredients(recipe, ingredients)
+            recipe_contents_changed.send(sender=Recipe, recipe=recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        instance.tags.set(tags)
-        self.create_ingredients(instance, ingredients)
-        return super().update(instance, validated_data)
+        with deferred_refresh():
+            instance.ingredients.clear()
+            instance.tags.set(tags)
+            self.create_ingredients(instance, ingredients)
+            recipe_contents_changed.send(sender=Recipe, recipe=instance)
+            return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         context = {'request': self.context.get('request')}
         return GetRecipeSerializer(instance, context=context).data
 
 
-class GetRecipeSerializer(serializers.ModelSerializer):
+class GetRecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Полная информация о рецепте."""
     tags = TagSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
@@ -147,6 +225,14 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                   'is_favorited', 'is_in_shopping_cart',
                   'name', 'image', 'text', 'cooking_time')
 
+    compact_fields = {
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+        'author': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'ingredients': lambda: CompactRecipeIngredientSerializer(
+            read_only=True, many=True, source='recipe_ingredient'),
+    }
+
     def get_is_favorited(self, obj):
         user = self.context.get('request').user
         if user.is_authenticated:
@@ -167,33 +253,6 @@ class RecipeInfoSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Добавление и удаление рецепта в избранном."""
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
-
-    def validate(self, data):
-        user = data.get('user')
-        recipe = data.get('recipe')
-        if self.Meta.model.objects.filter(user=user, recipe=recipe).exists():
-            raise ValidationError(
-                {'error': 'Этот рецепт уже добавлен'}
-            )
-        return data
-
-    def to_representation(self, instance):
-        context = {'request': self.context.get('request')}
-        return RecipeInfoSerializer(instance.recipe, context=context).data
-
-
-class ShoppingCartSerializer(FavoriteSerializer):
-    """Добавление и удаление рецепта в списке покупок."""
-    class Meta:
-        model = Shopping
-        fields = ('user', 'recipe')
-
-
 class UsersCreateSerializer(UserCreateSerializer):
     """Создание пользователя."""
     class Meta:
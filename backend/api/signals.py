@@ -0,0 +1,147 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import revoke_token, revoke_user_tokens
+from api.cards import schedule_refresh
+from api.representations import AUTHOR_FIELDS
+from foodgram.response_cache import invalidate_responses
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import recipe_contents_changed
+from users.models import User
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    revoke_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+# Карточки рецептов обновляются в той же транзакции, что и данные,
+# из которых они собраны.
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_card(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_refresh([instance.pk])
+
+
+@receiver(recipe_contents_changed)
+def refresh_contents_card(sender, recipe, **kwargs):
+    schedule_refresh([recipe.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_ingredient_card(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_refresh([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=RecipeIngredient)
+def refresh_relation_cards(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._card_recipe_ids = list(
+            instance.recipes.values_list('id', flat=True)
+            if isinstance(instance, Tag) else
+            instance.recipe.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        schedule_refresh([instance.pk])
+    elif action == 'post_clear':
+        schedule_refresh(getattr(instance, '_card_recipe_ids', ()))
+    else:
+        schedule_refresh(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def refresh_tag_cards(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        schedule_refresh(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_cards(sender, instance, created, raw=False,
+                             **kwargs):
+    if not created and not raw:
+        schedule_refresh(RecipeIngredient.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def refresh_author_cards(sender, instance, created, raw=False,
+                         update_fields=None, **kwargs):
+    if created or raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        return
+    schedule_refresh(instance.recipes.values_list('id', flat=True))
+
+
+# При удалении тега или автора связи с рецептами удаляются без сигналов,
+# поэтому рецепты запоминаются до удаления.
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=User)
+def remember_card_recipes(sender, instance, **kwargs):
+    instance._card_recipe_ids = list(
+        instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=User)
+def refresh_deleted_relation_cards(sender, instance, **kwargs):
+    schedule_refresh(getattr(instance, '_card_recipe_ids', ()))
+
+
+# Ответы анонимным пользователям собраны из рецептов, тегов, ингредиентов
+# и пользователей, поэтому любое их изменение сбрасывает кэш ответов.
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_model_responses(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_responses()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=RecipeIngredient)
+def invalidate_relation_responses(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_responses()
+
+
+@receiver(recipe_contents_changed)
+def invalidate_contents_responses(sender, **kwargs):
+    invalidate_responses()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_responses(sender, created, raw=False, update_fields=None,
+                              **kwargs):
+    # Вход пользователя обновляет только last_login.
+    if raw or update_fields is not None and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        return
+    invalidate_responses()
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_responses(sender, **kwargs):
+    invalidate_responses()
@@ -0,0 +1,146 @@
+import math
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class ActionRateThrottle(SimpleRateThrottle):
+    """Ограничение частоты запросов по областям действий представления.
+
+    Область задаётся словарём view.throttle_scopes вида {action: scope},
+    действия вне словаря не ограничиваются. Ключ вида action.format
+    задаёт отдельную область для формата ответа, например потоковой
+    выгрузки в ndjson. Для списков стоимость запроса
+    растёт вместе с размером страницы из параметра limit.
+    """
+    cache = caches['throttle']
+    scope_suffix = ''
+    cost_scopes = ('list',)
+
+    def __init__(self):
+        # Область и частота известны только в allow_request.
+        pass
+
+    def get_ident_key(self, request):
+        raise NotImplementedError('.get_ident_key() must be overridden')
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident_key(request),
+        }
+
+    def get_cost(self, request, view, scope):
+        paginator = getattr(view, 'paginator', None)
+        if scope not in self.cost_scopes or paginator is None:
+            return 1
+        page_size = paginator.get_page_size(request) or api_settings.PAGE_SIZE
+        return math.ceil(page_size / api_settings.PAGE_SIZE)
+
+    def get_scope(self, request, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        renderer = getattr(request, 'accepted_renderer', None)
+        if renderer is not None:
+            scope = scopes.get(f'{view.action}.{renderer.format}')
+            if scope is not None:
+                return scope
+        return scopes.get(view.action)
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        if scope is None:
+            return True
+        self.scope = scope + self.scope_suffix
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.cost = min(self.get_cost(request, view, scope),
+                        self.num_requests)
+
+        self.key = self.get_cache_key(request, view)
+        self.history = self.cache.get(self.key, [])
+        self.now = self.timer()
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        if len(self.history) + self.cost > self.num_requests:
+            return self.throttle_failure()
+        self.history[:0] = [self.now] * self.cost
+        self.cache.set(self.key, self.history, self.duration)
+        return True
+
+    def wait(self):
+        # Ждать нужно, пока не освободится место под всю стоимость запроса.
+        expires = self.history[self.num_requests - self.cost] + self.duration
+        return max(expires - self.now, 1)
+
+
+class ActionUserRateThrottle(ActionRateThrottle):
+    """Ограничение по пользователю, для анонимов — по IP."""
+    def get_ident_key(self, request):
+        if request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class ActionIPRateThrottle(ActionRateThrottle):
+    """Ограничение по IP независимо от пользователя."""
+    scope_suffix = '_ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+@contextmanager
+def concurrency_limit(name, limit):
+    """Ограничивает число одновременных тяжёлых операций.
+
+    Счётчик живёт в кэше throttle и сбрасывается через
+    CONCURRENCY_LIMIT_TIMEOUT секунд, чтобы слоты, занятые упавшими
+    воркерами, не терялись навсегда.
+    """
+    cache = caches['throttle']
+    key = f'concurrency_{name}'
+    cache.add(key, 0, settings.CONCURRENCY_LIMIT_TIMEOUT)
+    try:
+        slots = cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, settings.CONCURRENCY_LIMIT_TIMEOUT)
+        slots = 1
+    if slots > limit:
+        cache.decr(key)
+        raise Throttled(wait=settings.CONCURRENCY_LIMIT_RETRY_AFTER)
+    try:
+        yield
+    finally:
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+
+@contextmanager
+def concurrency_slot(name, limit, owner, timeout):
+    """Занимает один из limit слотов для долгой фоновой операции.
+
+    Каждый слот — отдельная запись в кэше throttle со значением owner,
+    которая живёт timeout секунд. Владелец продлевает её через
+    caches['throttle'].touch, пока работает, поэтому слот остановленного
+    воркера освобождается через timeout. Возвращает ключ слота.
+    """
+    cache = caches['throttle']
+    for number in range(limit):
+        key = f'concurrency_{name}_{number}'
+        if cache.add(key, owner, timeout):
+            break
+    else:
+        raise Throttled(wait=settings.CONCURRENCY_LIMIT_RETRY_AFTER)
+    try:
+        yield key
+    finally:
+        if cache.get(key) == owner:
+            cache.delete(key)
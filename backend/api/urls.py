@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
-                       UsersViewSet)
+from api.views import (IngredientViewSet, RecipeViewSet, SyncViewSet,
+                       TagViewSet, UsersViewSet)
 
 
 router = DefaultRouter()
@@ -10,6 +10,7 @@ router.register(r'users', UsersViewSet)
 router.register(r'ingredients', IngredientViewSet)
 router.register(r'recipes', RecipeViewSet)
 router.register(r'tags', TagViewSet)
+router.register(r'sync', SyncViewSet, basename='sync')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,26 +1,51 @@
-from reportlab.pdfbase import pdfmetrics, ttfonts
-from reportlab.pdfgen import canvas
+from datetime import timedelta
+from functools import lru_cache
 
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import Exists, F, Max, OuterRef, Sum
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from recipes.models import Follow, Ingredient, Recipe, RecipeIngredient, Tag
+from foodgram.response_cache import cache_anonymous_response
+from foodgram.upsert import insert_ignore
+from recipes.models import (Change, Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredient, Shopping, Tag)
 from users.models import User
-from api.filters import IngredientFilter, RecipeFilter
+from api.cookbook import get_cookbook_path, get_favorites, start_export
+from api.filters import IngredientFilter, RecipeFilter, get_tag_facets
 from api.pagination import LimitPagination
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (CustomUserSerializer, FavoriteSerializer,
-                             FollowSerializer, IngredientSerializer,
-                             RecipeSerializer, ShoppingCartSerializer,
+from api.renderers import NDJSONRenderer, stream_ndjson
+from api.fieldsets import only_selected, parse_list
+from api.representations import (recipe_rows, represent_recipes,
+                                 select_recipe_fields)
+from api.serializers import (CustomUserSerializer, FollowSerializer,
+                             GetRecipeSerializer, IngredientSerializer,
+                             RecipeInfoSerializer, RecipeSerializer,
                              TagSerializer)
+from api.throttling import (ActionIPRateThrottle, ActionUserRateThrottle,
+                            concurrency_limit)
+
+PDF_FONT = 'Arial'
+
+
+@lru_cache(maxsize=None)
+def register_pdf_font():
+    """Загружает reportlab и шрифт только при первой выгрузке PDF."""
+    from reportlab.pdfbase import pdfmetrics, ttfonts
+
+    pdfmetrics.registerFont(ttfonts.TTFont(
+        PDF_FONT, settings.BASE_DIR / 'data' / 'arial.ttf'))
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -49,36 +74,156 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = LimitPagination
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES,
+                        NDJSONRenderer)
+    throttle_classes = (ActionUserRateThrottle, ActionIPRateThrottle)
+    throttle_scopes = {
+        'list': 'list',
+        'list.ndjson': 'export',
+        'cook': 'list',
+        'create': 'upload',
+        'update': 'upload',
+        'partial_update': 'upload',
+        'download_shopping_cart': 'export',
+        'download_cookbook': 'cookbook',
+    }
 
-    def action_post_delete(self, pk, serializer_class):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        obj = serializer_class.Meta.model.objects.filter(
-            user=user, recipe=recipe
-        )
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            return select_recipe_fields(
+                queryset, GetRecipeSerializer.get_selection(self.request))
+        return queryset
 
+    @cache_anonymous_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @cache_anonymous_response
+    def list(self, request, *args, **kwargs):
+        selection = GetRecipeSerializer.get_selection(request)
+        facets = parse_list(request, 'facets') or set()
+        if facets - {'tags'}:
+            raise ValidationError({'facets': 'Доступен только facets=tags'})
+        queryset = recipe_rows(
+            self.filter_queryset(self.get_queryset()), selection)
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            return stream_ndjson(queryset, lambda rows: represent_recipes(
+                rows, request, selection))
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(
+            represent_recipes(page, request, selection))
+        if facets:
+            response.data['facets'] = {
+                'tags': get_tag_facets(request, self.get_queryset())}
+        return response
+
+    def action_post_delete(self, pk, model):
+        user = self.request.user
         if self.request.method == 'POST':
-            serializer = serializer_class(
-                data={'user': user.id, 'recipe': pk},
-                context={'request': self.request}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            recipe = get_object_or_404(
+                Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+                pk=pk)
+            if not insert_ignore(model, user_id=user.id, recipe_id=recipe.id):
+                raise ValidationError({'error': 'Этот рецепт уже добавлен'})
+            serializer = RecipeInfoSerializer(
+                recipe, context={'request': self.request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if self.request.method == 'DELETE':
-            if obj.exists():
-                obj.delete()
+            deleted, _ = model.objects.filter(
+                user=user, recipe_id=pk).delete()
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(methods=['POST', 'DELETE'], detail=True)
     def favorite(self, request, pk):
-        return self.action_post_delete(pk, FavoriteSerializer)
+        return self.action_post_delete(pk, Favorite)
 
     @action(methods=['POST', 'DELETE'], detail=True)
     def shopping_cart(self, request, pk):
-        return self.action_post_delete(pk, ShoppingCartSerializer)
+        return self.action_post_delete(pk, Shopping)
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        recipe = get_object_or_404(Recipe, pk=pk)
+        recipes = Recipe.objects.filter(
+            similar_to__recipe=recipe).order_by('-similar_to__score')
+        serializer = RecipeInfoSerializer(recipes, many=True,
+                                          context={'request': request})
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def cook(self, request):
+        from recipes.ingredient_index import ingredient_index
+
+        try:
+            ingredients = [
+                int(ingredient) for value in request.query_params.getlist(
+                    'ingredients') for ingredient in value.split(',')
+            ]
+            min_coverage = float(request.query_params.get('min_coverage',
+                                                          0.5))
+        except ValueError:
+            min_coverage = None
+        if min_coverage is None or not 0 <= min_coverage <= 1:
+            raise ValidationError(
+                {'error': 'Укажите id ингредиентов и долю от 0 до 1'})
+        recipe_ids, coverage = ingredient_index.search(ingredients,
+                                                       min_coverage)
+        coverage = dict(zip(recipe_ids.tolist(), coverage.tolist()))
+        page = self.paginate_queryset(list(coverage))
+        selection = GetRecipeSerializer.get_selection(request)
+        rows = {row['id']: row for row in recipe_rows(
+            Recipe.objects.filter(id__in=page), selection)}
+        data = represent_recipes(
+            [rows[recipe_id] for recipe_id in page if recipe_id in rows],
+            request, selection)
+        for recipe in data:
+            recipe['coverage'] = coverage[recipe['id']]
+        return self.get_paginated_response(data)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def relations(self, request):
+        try:
+            ids = {
+                int(recipe_id) for value in request.query_params.getlist(
+                    'ids') for recipe_id in value.split(',')
+            }
+        except ValueError:
+            raise ValidationError({'error': 'Укажите id рецептов'})
+        if len(ids) > settings.RECIPE_RELATIONS_MAX_IDS:
+            raise ValidationError({
+                'error': f'Не больше {settings.RECIPE_RELATIONS_MAX_IDS} '
+                         f'рецептов за запрос'
+            })
+        user = request.user
+        rows = Recipe.objects.filter(id__in=ids).annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Shopping.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author'))),
+        ).order_by('id').values('id', 'author_id', 'is_favorited',
+                                'is_in_shopping_cart', 'is_subscribed')
+        recipes, authors = [], {}
+        for row in rows:
+            recipes.append({
+                'id': row['id'],
+                'is_favorited': row['is_favorited'],
+                'is_in_shopping_cart': row['is_in_shopping_cart'],
+            })
+            if row['author_id'] is not None:
+                authors[row['author_id']] = row['is_subscribed']
+        return Response({
+            'recipes': recipes,
+            'authors': [
+                {'id': author_id, 'is_subscribed': is_subscribed}
+                for author_id, is_subscribed in authors.items()
+            ],
+        })
 
     @action(detail=False)
     def download_shopping_cart(self, request):
@@ -86,31 +231,121 @@ class RecipeViewSet(viewsets.ModelViewSet):
         response['Content-Disposition'] = (
             "attachment; filename='shopping_cart.pdf'"
         )
-        p = canvas.Canvas(response)
-        arial = ttfonts.TTFont('Arial', 'data/arial.ttf')
-        pdfmetrics.registerFont(arial)
-        p.setFont('Arial', 14)
-
         ingredients = RecipeIngredient.objects.filter(
             recipe__shopping_list__user=request.user).values(
             name=F('ingredient__name'),
             measurement_unit=F('ingredient__measurement_unit')).annotate(
             amount=Sum('amount')).order_by('-amount')
 
-        height = 700
-
-        p.drawString(100, 750, 'Список покупок')
-        for ingredient in ingredients:
-            p.drawString(
-                80, height,
-                f"{ingredient['name']} – {ingredient['amount']} "
-                f"{ingredient['measurement_unit']}"
-            )
-            height -= 25
-        p.showPage()
-        p.save()
+        register_pdf_font()
+        from reportlab.pdfgen import canvas
+
+        with concurrency_limit('pdf', settings.PDF_RENDER_CONCURRENCY):
+            p = canvas.Canvas(response)
+            p.setFont(PDF_FONT, 14)
+
+            height = 700
+
+            p.drawString(100, 750, 'Список покупок')
+            for ingredient in ingredients:
+                p.drawString(
+                    80, height,
+                    f"{ingredient['name']} – {ingredient['amount']} "
+                    f"{ingredient['measurement_unit']}"
+                )
+                height -= 25
+            p.showPage()
+            p.save()
         return response
 
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def download_cookbook(self, request):
+        """Книга избранных рецептов в PDF.
+
+        Книга собирается в фоне: пока её нет, ответ — 202 с Retry-After,
+        и клиент повторяет запрос. Готовая книга хранится до изменения
+        избранного или входящих в неё рецептов.
+        """
+        recipes, version = get_favorites(request.user)
+        if not recipes:
+            raise ValidationError({'error': 'В избранном нет рецептов'})
+        path = get_cookbook_path(request.user.id, version)
+        try:
+            return FileResponse(open(path, 'rb'), as_attachment=True,
+                                filename='cookbook.pdf',
+                                content_type='application/pdf')
+        except FileNotFoundError:
+            pass
+        start_export(request.user.id, version, recipes)
+        return Response(
+            {'status': 'Книга рецептов готовится'},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Retry-After': str(settings.COOKBOOK_RETRY_AFTER)})
+
+
+class SyncViewSet(viewsets.GenericViewSet):
+    """Изменения тегов, ингредиентов и рецептов после токена since.
+
+    Без since возвращается только текущий токен: клиент загружает полные
+    списки и дальше запрашивает изменения с этим токеном.
+    Изменения отдаются не раньше чем через SYNC_TOKEN_LAG секунд: id
+    выдаются при вставке, и транзакция с меньшим id может зафиксироваться
+    позже. Токен, выданный до её фиксации, пропустил бы это изменение.
+    """
+    queryset = Change.objects.all()
+    permission_classes = (AllowAny,)
+    throttle_classes = (ActionUserRateThrottle, ActionIPRateThrottle)
+    throttle_scopes = {
+        'list': 'list',
+    }
+
+    def list(self, request):
+        settled = Change.objects.filter(
+            created__lte=timezone.now()
+            - timedelta(seconds=settings.SYNC_TOKEN_LAG))
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({
+                'token': settled.aggregate(token=Max('id'))['token'] or 0,
+                'has_more': False,
+            })
+        try:
+            since = int(since)
+        except ValueError:
+            raise ValidationError({'since': 'Токен должен быть числом'})
+
+        changes = list(settled.filter(id__gt=since).values_list(
+            'id', 'model', 'object_id', 'deleted'
+        )[:settings.SYNC_PAGE_SIZE + 1])
+        has_more = len(changes) > settings.SYNC_PAGE_SIZE
+        changes = changes[:settings.SYNC_PAGE_SIZE]
+        updated = {model: [] for model, _ in Change.MODELS}
+        deleted = {model: [] for model, _ in Change.MODELS}
+        for _, model, object_id, is_deleted in changes:
+            (deleted if is_deleted else updated)[model].append(object_id)
+
+        tags = TagSerializer(
+            Tag.objects.filter(id__in=updated[Change.TAG]), many=True).data
+        ingredients = IngredientSerializer(
+            Ingredient.objects.filter(id__in=updated[Change.INGREDIENT]),
+            many=True).data
+        recipes = represent_recipes(recipe_rows(
+            Recipe.objects.filter(id__in=updated[Change.RECIPE])
+        ), request) if updated[Change.RECIPE] else []
+        return Response({
+            'token': changes[-1][0] if changes else since,
+            'has_more': has_more,
+            'tags': {'updated': tags, 'deleted': deleted[Change.TAG]},
+            'ingredients': {
+                'updated': ingredients,
+                'deleted': deleted[Change.INGREDIENT],
+            },
+            'recipes': {
+                'updated': recipes,
+                'deleted': deleted[Change.RECIPE],
+            },
+        })
+
 
 class UsersViewSet(UserViewSet):
     """Работа с пользователями и подписками."""
@@ -119,6 +354,33 @@ class UsersViewSet(UserViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = LimitPagination
     http_method_names = ['get', 'post', 'delete', 'head']
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES,
+                        NDJSONRenderer)
+    throttle_classes = (ActionUserRateThrottle, ActionIPRateThrottle)
+    throttle_scopes = {
+        'list': 'list',
+        'subscriptions': 'list',
+        'subscriptions.ndjson': 'export',
+    }
+    max_page_sizes = {
+        'subscriptions': settings.SUBSCRIPTIONS_MAX_PAGE_SIZE,
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return only_selected(
+                queryset, self.get_serializer_class().get_selection(
+                    self.request))
+        return queryset
+
+    @cache_anonymous_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def get_permissions(self):
         if self.action == 'me':
@@ -128,26 +390,31 @@ class UsersViewSet(UserViewSet):
     @action(methods=['POST', 'DELETE'], detail=True,)
     def subscribe(self, request, id):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        subscription = Follow.objects.filter(user=user, author=author)
 
         if request.method == 'POST':
+            author = get_object_or_404(User, id=id)
             if user == author:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
+            insert_ignore(Follow, user_id=user.id, author_id=author.id)
             serializer = FollowSerializer(author, context={'request': request})
-            Follow.objects.get_or_create(user=user, author=author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if subscription.exists():
-                subscription.delete()
+            deleted, _ = Follow.objects.filter(
+                user=user, author_id=id).delete()
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        follows = User.objects.filter(following__user=user)
+        follows = only_selected(
+            User.objects.filter(following__user=user),
+            FollowSerializer.get_selection(request))
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            return stream_ndjson(follows, lambda authors: FollowSerializer(
+                authors, many=True, context={'request': request}).data)
         page = self.paginate_queryset(follows)
         serializer = FollowSerializer(page, many=True,
                                       context={'request': request})
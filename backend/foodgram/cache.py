@@ -0,0 +1,290 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET entries = entries + 1, size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET entries = entries - 1, size = size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE cache_stats SET size = size - OLD.size + NEW.size;
+END;
+'''
+
+UPSERT = '''
+INSERT INTO cache (key, value, size, expires, accessed)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value,
+    size = excluded.size,
+    expires = excluded.expires,
+    accessed = excluded.accessed
+'''
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite в режиме WAL, общий для всех процессов хоста.
+
+    LOCATION — путь к файлу базы; лучше держать его в tmpfs, например
+    в /dev/shm. Кроме MAX_ENTRIES и CULL_FREQUENCY, в OPTIONS задаются
+    MAX_SIZE — наибольший общий размер значений в байтах,
+    MAX_VALUE_SIZE — наибольший размер одного значения, по умолчанию доля
+    MAX_SIZE, освобождаемая одним вытеснением, — и LRU_RESOLUTION — через
+    сколько секунд чтение снова обновляет время доступа записи. Без него
+    каждое чтение было бы записью в базу, поэтому вытеснение давно не
+    читавшихся записей приблизительное. Значения больше MAX_VALUE_SIZE не
+    сохраняются: ради них пришлось бы вытеснить весь кэш.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = Path(location)
+        self._max_size = options.get('MAX_SIZE')
+        self._max_value_size = options.get('MAX_VALUE_SIZE')
+        if self._max_value_size is None and self._max_size is not None:
+            self._max_value_size = (
+                self._max_size // self._cull_frequency
+                if self._cull_frequency else self._max_size)
+        self._lru_resolution = options.get('LRU_RESOLUTION', 60)
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    def _connection(self):
+        # После fork соединение родителя использовать нельзя.
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(
+            self._path, timeout=self._busy_timeout, isolation_level=None)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute('PRAGMA mmap_size = 268435456')
+        connection.executescript(SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _write(self):
+        """Транзакция, которая сразу берёт блокировку записи."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _dumps(self, key, value):
+        data = pickle.dumps(value, self.pickle_protocol)
+        return data, len(key) + len(data)
+
+    def _store(self, connection, key, value, timeout, only_expired=False):
+        data, size = self._dumps(key, value)
+        if self._max_value_size is not None and size > self._max_value_size:
+            if not only_expired:
+                # Как и после вытеснения, прежнее значение не возвращается.
+                connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return False
+        now = time.time()
+        sql = UPSERT
+        params = [key, data, size, self.get_backend_timeout(timeout), now]
+        if only_expired:
+            sql += 'WHERE cache.expires IS NOT NULL AND cache.expires <= ?'
+            params.append(now)
+        stored = connection.execute(sql, params).rowcount == 1
+        if stored:
+            self._cull(connection, now)
+        return stored
+
+    def _cull(self, connection, now):
+        """Вытесняет записи, если превышено число записей или их размер.
+
+        Сначала удаляются истёкшие записи, затем давно не читавшиеся, пока
+        не освободится 1/CULL_FREQUENCY места.
+        """
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        if not self._over_limit(entries, size):
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        if not self._over_limit(entries, size):
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        max_entries = entries
+        if entries > self._max_entries:
+            max_entries = (self._max_entries
+                           - self._max_entries // self._cull_frequency)
+        max_size = size
+        if self._max_size is not None and size > self._max_size:
+            max_size = self._max_size - self._max_size // self._cull_frequency
+        victims = []
+        for key, entry_size in connection.execute(
+                'SELECT key, size FROM cache ORDER BY accessed'):
+            if entries <= max_entries and size <= max_size:
+                break
+            victims.append((key,))
+            entries -= 1
+            size -= entry_size
+        connection.executemany('DELETE FROM cache WHERE key = ?', victims)
+
+    def _over_limit(self, entries, size):
+        return entries > self._max_entries or (
+            self._max_size is not None and size > self._max_size)
+
+    def _fetch(self, keys):
+        """Неистёкшие значения по ключам с обновлением времени доступа."""
+        connection = self._connection()
+        now = time.time()
+        rows = connection.execute(
+            'SELECT key, value, accessed FROM cache '
+            'WHERE (expires IS NULL OR expires > ?) '
+            f'AND key IN ({", ".join("?" * len(keys))})',
+            (now, *keys)).fetchall()
+        stale = [(now, key) for key, _, accessed in rows
+                 if accessed < now - self._lru_resolution]
+        if stale:
+            # Чтение не ждёт писателей: если база занята записью, время
+            # доступа обновится в другой раз.
+            connection.execute('PRAGMA busy_timeout = 0')
+            try:
+                connection.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?', stale)
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                connection.execute(
+                    f'PRAGMA busy_timeout = {int(self._busy_timeout * 1000)}')
+        return {key: pickle.loads(value) for key, value, _ in rows}
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            return self._store(connection, key, value, timeout, True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        keys = {self.make_and_validate_key(key, version=version): key
+                for key in keys}
+        return {keys[key]: value
+                for key, value in self._fetch(list(keys)).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            self._store(connection, key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = []
+        with self._write() as connection:
+            for key, value in data.items():
+                if not self._store(connection, self.make_and_validate_key(
+                        key, version=version), value, timeout):
+                    failed.append(key)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            return connection.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, time.time())
+            ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно для всех процессов, в отличие от BaseCache.incr."""
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data, size = self._dumps(key, value)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (data, size, key))
+        return value
+
+    def incr_version(self, key, delta=1, version=None):
+        """Переносит запись на другую версию ключа одной транзакцией."""
+        if version is None:
+            version = self.version
+        old_key = self.make_and_validate_key(key, version=version)
+        new_key = self.make_and_validate_key(key, version=version + delta)
+        with self._write() as connection:
+            if connection.execute(
+                    'SELECT 1 FROM cache WHERE key = ? '
+                    'AND (expires IS NULL OR expires > ?)',
+                    (old_key, time.time())).fetchone() is None:
+                raise ValueError(f"Key '{key}' not found")
+            connection.execute('DELETE FROM cache WHERE key = ?', (new_key,))
+            connection.execute(
+                'UPDATE cache SET key = ? WHERE key = ?', (new_key, old_key))
+        return version + delta
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            return connection.execute(
+                'DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        with self._write() as connection:
+            connection.executemany('DELETE FROM cache WHERE key = ?', [
+                (self.make_and_validate_key(key, version=version),)
+                for key in keys])
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт всё время процесса, как у LocMemCache.
+        pass
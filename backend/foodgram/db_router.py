@@ -0,0 +1,114 @@
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.throttling import BaseThrottle
+
+from foodgram.streaming import wrap_streaming_content
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+def get_replica():
+    """Реплика, выбранная для текущего запроса, или None."""
+    replica = getattr(_state, 'replica', None)
+    if replica and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return replica
+    return None
+
+
+@contextmanager
+def use_replica(replica):
+    _state.replica = replica
+    try:
+        yield
+    finally:
+        _state.replica = None
+
+
+def get_pin_key(credentials):
+    digest = hashlib.sha256(credentials.encode()).hexdigest()
+    return f'primary-pin:{digest}'
+
+
+def get_pin_keys(request):
+    """Ключи закрепления клиента: его IP и учётные данные запроса.
+
+    IP берётся из X-Forwarded-For так же, как в ограничениях частоты
+    запросов: REMOTE_ADDR — адрес nginx, общий для всех клиентов.
+    """
+    keys = [get_pin_key(f'ip:{BaseThrottle().get_ident(request)}')]
+    credentials = (request.META.get('HTTP_AUTHORIZATION')
+                   or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if credentials:
+        keys.append(get_pin_key(credentials))
+    return keys
+
+
+def get_issued_credentials(response):
+    """Токен, выданный в ответе на вход, в виде заголовка Authorization."""
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and isinstance(data.get('auth_token'), str):
+        return f'Token {data["auth_token"]}'
+    return None
+
+
+class PrimaryReplicaRouter:
+    """Чтение в безопасных запросах идёт на реплики, остальное на primary.
+
+    Токены всегда читаются с primary: только что выданный токен может ещё
+    не дойти до реплики, а их проверка и так кэшируется.
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.label == 'authtoken.Token':
+            return DEFAULT_DB_ALIAS
+        return get_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Выбирает реплику для безопасных запросов.
+
+    После POST/PATCH/DELETE клиент на READ_YOUR_WRITES_TIMEOUT секунд
+    закрепляется за primary, чтобы сразу видеть свои изменения, пока
+    реплики догоняют основную базу. Закрепляются его IP, учётные данные
+    запроса и токен, выданный при входе. Тело потокового ответа читается
+    с той же реплики, что и остальной запрос.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        pin_keys = get_pin_keys(request)
+        replica = None
+        if (request.method in SAFE_METHODS
+                and not cache.get_many(pin_keys)):
+            replica = random.choice(settings.DATABASE_REPLICAS)
+        with use_replica(replica):
+            response = self.get_response(request)
+        if replica is not None and response.streaming:
+            wrap_streaming_content(response, lambda: use_replica(replica))
+        if request.method not in SAFE_METHODS:
+            # После входа следующие запросы придут уже с выданным токеном.
+            issued = get_issued_credentials(response)
+            if issued is not None:
+                pin_keys.append(get_pin_key(issued))
+            cache.set_many(dict.fromkeys(pin_keys, True),
+                           settings.READ_YOUR_WRITES_TIMEOUT)
+        return response
@@ -0,0 +1,181 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.authentication import CachedTokenAuthentication
+from foodgram.streaming import wrap_streaming_content
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+SIGNING_SALT = 'foodgram.profiling'
+SIGNED_VALUE = 'profile'
+
+
+def sign_profile_header():
+    """Значение заголовка X-Profile, включающее профилирование без входа."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(SIGNED_VALUE)
+
+
+def has_valid_signature(value):
+    try:
+        return signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            value, max_age=settings.PROFILING_SIGNATURE_MAX_AGE
+        ) == SIGNED_VALUE
+    except signing.BadSignature:
+        return False
+
+
+def get_staff_user(request):
+    """Сотрудник из сессии или из токена запроса."""
+    if request.user.is_staff:
+        return request.user
+    try:
+        credentials = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if credentials is not None and credentials[0].is_staff:
+        return credentials[0]
+    return None
+
+
+class QueryRecorder:
+    """Записывает SQL-запросы и их длительность через execute_wrapper."""
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < settings.PROFILING_MAX_QUERIES:
+                self.queries.append({
+                    'alias': self.alias,
+                    'sql': sql,
+                    'time': time.perf_counter() - start,
+                })
+
+
+def get_top_functions(profiler, limit):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in (
+            stats.stats.items()):
+        rows.append({
+            'function': f'{filename}:{line}({name})',
+            'calls': calls,
+            'own': own,
+            'cumulative': cumulative,
+        })
+    rows.sort(key=lambda row: row['cumulative'], reverse=True)
+    return rows[:limit]
+
+
+def get_profile_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def list_profiles():
+    """Файлы профилей от старых к новым."""
+    directory = get_profile_dir()
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob('*.json'))
+
+
+def save_profile(profile):
+    directory = get_profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{profile["id"]}.json'
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(profile, ensure_ascii=False))
+    os.replace(temporary, path)
+    for old in list_profiles()[:-settings.PROFILING_MAX_ENTRIES]:
+        try:
+            old.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def load_profile(profile_id):
+    path = get_profile_dir() / f'{profile_id}.json'
+    return json.loads(path.read_text())
+
+
+class ProfilingMiddleware:
+    """Профилирует отдельный запрос с заголовком X-Profile.
+
+    Заголовок учитывается у сотрудников или если он подписан командой
+    profiles sign. Результат — самые дорогие функции cProfile и SQL-запросы
+    — сохраняется в PROFILING_DIR, где хранятся последние
+    PROFILING_MAX_ENTRIES профилей, а его id возвращается в X-Profile-Id.
+    Потоковый ответ профилируется вместе с выдачей тела, и профиль
+    сохраняется после его закрытия.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        value = request.META.get(PROFILE_HEADER)
+        if not value:
+            return False
+        return (has_valid_signature(value)
+                or get_staff_user(request) is not None)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        recorders = [QueryRecorder(alias) for alias in connections]
+        profiler = cProfile.Profile()
+
+        @contextmanager
+        def record():
+            with ExitStack() as stack:
+                for recorder in recorders:
+                    stack.enter_context(
+                        connections[recorder.alias].execute_wrapper(recorder))
+                profiler.enable()
+                try:
+                    yield
+                finally:
+                    profiler.disable()
+
+        started = time.time()
+        start = time.perf_counter()
+        with record():
+            response = self.get_response(request)
+        profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+
+        def save():
+            queries = [query for recorder in recorders
+                       for query in recorder.queries]
+            save_profile({
+                'id': profile_id,
+                'started': started,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'duration': time.perf_counter() - start,
+                'sql_time': sum(query['time'] for query in queries),
+                'queries': queries,
+                'functions': get_top_functions(
+                    profiler, settings.PROFILING_TOP_FUNCTIONS),
+            })
+
+        response['X-Profile-Id'] = profile_id
+        if response.streaming:
+            wrap_streaming_content(response, record, save)
+        else:
+            save()
+        return response
@@ -0,0 +1,91 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+GENERATION_KEY = 'response_cache_generation'
+
+
+def get_generation():
+    """Текущее поколение кэша ответов.
+
+    Начальное значение берётся из времени, чтобы после вытеснения ключа
+    поколение не повторило одно из прежних. Обычно ключ уже есть, и
+    запрос обходится чтением без блокировки записи в общем кэше.
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Делает недействительными все сохранённые ответы."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate_responses():
+    """Меняет поколение после фиксации текущей транзакции.
+
+    Иначе параллельный запрос мог бы сохранить ещё старые данные уже под
+    новым поколением.
+    """
+    transaction.on_commit(bump_generation)
+
+
+def get_cache_key(request, view):
+    """Ключ ответа для анонимного запроса в JSON или None.
+
+    Параметры запроса упорядочиваются, поэтому ?tags=a&tags=b и
+    ?tags=b&tags=a дают один ключ. Адрес с хостом входит в ключ, потому что
+    ссылки на изображения в ответе абсолютные.
+    """
+    if request.user.is_authenticated or request.auth is not None:
+        return None
+    if request.accepted_renderer.format != 'json':
+        return None
+    params = sorted(
+        (name, sorted(values))
+        for name, values in request.query_params.lists())
+    digest = hashlib.sha1(repr((
+        request.build_absolute_uri(request.path), params,
+        request.accepted_media_type,
+    )).encode()).hexdigest()
+    return f'response_{get_generation()}_{view.basename}_{digest}'
+
+
+def cache_anonymous_response(method):
+    """Кэширует ответ действия представления для анонимных пользователей.
+
+    Для них отметки is_favorited, is_in_shopping_cart и is_subscribed
+    всегда ложны, поэтому ответ зависит только от адреса. Сохраняется
+    отрендеренный ответ, и при попадании в кэш к базе нет ни одного
+    запроса. Ответы сбрасываются сменой поколения при изменении рецептов,
+    тегов, ингредиентов и пользователей, а в остальном живут не дольше
+    RESPONSE_CACHE_TIMEOUT секунд.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = get_cache_key(request, self)
+        if key is None:
+            return method(self, request, *args, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(lambda response: cache.set(
+                key, (response.content, response['Content-Type']),
+                settings.RESPONSE_CACHE_TIMEOUT))
+        return response
+    return wrapper
@@ -56,6 +56,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.profiling.ProfilingMiddleware',
+    'foodgram.slow_queries.SlowQueryMiddleware',
+    'foodgram.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,16 +87,47 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+USE_SQLITE = os.getenv('USE_SQLITE', 'False') == 'True'
+
+if USE_SQLITE:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432)
+        }
+    }
+
+# Реплики для чтения: хосты PostgreSQL или, при USE_SQLITE, имена файлов
+# SQLite через запятую. Без реплик все запросы идут в default.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    if USE_SQLITE:
+        DATABASES[alias]['NAME'] = BASE_DIR / replica
+    else:
+        DATABASES[alias]['HOST'] = replica
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.db_router.PrimaryReplicaRouter']
+
+# Сколько секунд после изменяющего запроса клиент читает только с primary.
+READ_YOUR_WRITES_TIMEOUT = int(os.getenv('READ_YOUR_WRITES_TIMEOUT', 5))
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -119,14 +153,81 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
+    # Запросы приходят через nginx, который добавляет X-Forwarded-For.
+    'NUM_PROXIES': 1,
+    # Области export, upload и list задаются в throttle_scopes представлений,
+    # суффикс _ip — ограничение по IP-адресу клиента.
+    'DEFAULT_THROTTLE_RATES': {
+        'export': '10/minute',
+        'export_ip': '30/minute',
+        # Клиент опрашивает download_cookbook, пока книга собирается.
+        'cookbook': '30/minute',
+        'cookbook_ip': '60/minute',
+        'upload': '30/hour',
+        'upload_ip': '100/hour',
+        'list': '300/minute',
+        'list_ip': '600/minute',
+    },
+}
+
+# Кэши общие для всех воркеров gunicorn на хосте: это базы SQLite в режиме
+# WAL в каталоге CACHE_DIR, лучше в tmpfs. Записи переживают перезапуск,
+# поэтому при несовместимом изменении кэшируемых данных нужно увеличить
+# CACHE_VERSION: записи старой версии перестанут читаться и будут вытеснены.
+CACHE_DIR = Path(os.getenv('CACHE_DIR', BASE_DIR / 'cache'))
+CACHE_VERSION = int(os.getenv('CACHE_VERSION', 1))
+CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', 256 * 1024 * 1024))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'foodgram.cache.SQLiteCache',
+        'LOCATION': CACHE_DIR / 'default.sqlite3',
+        'VERSION': CACHE_VERSION,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': CACHE_MAX_SIZE,
+        },
+    },
+    'throttle': {
+        'BACKEND': 'foodgram.cache.SQLiteCache',
+        'LOCATION': CACHE_DIR / 'throttle.sqlite3',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
+# Не больше PDF_RENDER_CONCURRENCY одновременных выгрузок PDF, остальным
+# запросам возвращается 429 с Retry-After.
+PDF_RENDER_CONCURRENCY = int(os.getenv('PDF_RENDER_CONCURRENCY', 2))
+CONCURRENCY_LIMIT_TIMEOUT = 60
+CONCURRENCY_LIMIT_RETRY_AFTER = 5
+
+# Книги избранных рецептов: каталог готовых PDF и число процессов, которые
+# готовят страницы. Воркер продлевает отметку о сборке и свой слот, пока
+# собирает книгу; если он остановлен, они снимаются через
+# COOKBOOK_HEARTBEAT_TIMEOUT секунд, а сборка дольше COOKBOOK_RENDER_TIMEOUT
+# считается зависшей. На хосте собирается не больше COOKBOOK_MAX_EXPORTS
+# книг сразу, а пул процессов воркера останавливается, если
+# COOKBOOK_POOL_IDLE_TIMEOUT секунд не было сборок.
+COOKBOOK_DIR = Path(os.getenv('COOKBOOK_DIR', BASE_DIR / 'cookbooks'))
+COOKBOOK_PROCESSES = int(os.getenv('COOKBOOK_PROCESSES', 2))
+COOKBOOK_MAX_EXPORTS = int(os.getenv('COOKBOOK_MAX_EXPORTS', 2))
+COOKBOOK_POOL_IDLE_TIMEOUT = 60
+COOKBOOK_RENDER_TIMEOUT = 10 * 60
+COOKBOOK_HEARTBEAT_TIMEOUT = 15
+COOKBOOK_RETRY_AFTER = 3
+
 AUTH_USER_MODEL = 'users.User'
 
+# Кэш аутентификации по токену: время жизни записи в секундах и размер.
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 30))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -148,11 +249,88 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media'
 
+# Загруженные файлы хранятся под хешем содержимого, одинаковые — один раз.
+STORAGES = {
+    'default': {
+        'BACKEND': 'foodgram.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Профилирование отдельных запросов с заголовком X-Profile.
+PROFILING_DIR = os.getenv('PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_MAX_ENTRIES = int(os.getenv('PROFILING_MAX_ENTRIES', 50))
+PROFILING_TOP_FUNCTIONS = 50
+PROFILING_MAX_QUERIES = 1000
+PROFILING_SIGNATURE_MAX_AGE = 60 * 60
+
+# Наибольший размер страницы в параметре limit. Подписки включают рецепты
+# авторов, поэтому их страница меньше.
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+SUBSCRIPTIONS_MAX_PAGE_SIZE = int(os.getenv('SUBSCRIPTIONS_MAX_PAGE_SIZE', 20))
+
+# Размер пачки при потоковой выгрузке списков в формате ndjson.
+NDJSON_CHUNK_SIZE = 200
+
+# Файлы моложе этого срока reclaim_images --sweep не удаляет: рецепт,
+# к которому они загружены, может быть ещё не сохранён.
+ORPHANED_IMAGE_GRACE_PERIOD = 60 * 60
+
+# Журнал запросов к базе дольше SLOW_QUERY_THRESHOLD миллисекунд.
+# Без переменной окружения журнал не ведётся.
+SLOW_QUERY_THRESHOLD = (float(os.getenv('SLOW_QUERY_THRESHOLD'))
+                        if os.getenv('SLOW_QUERY_THRESHOLD') else None)
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', BASE_DIR / 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+# Файлы, загруженные через multipart/form-data, больше этого размера
+# пишутся во временный файл, а не держатся в памяти.
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 512 * 1024))
+
+# Сколько секунд хранятся ответы анонимным пользователям. Изменения
+# рецептов, тегов, ингредиентов и пользователей сбрасывают их сразу, но
+# только в кэше своего хоста.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Сколько рецептов можно передать в /api/recipes/relations/.
+RECIPE_RELATIONS_MAX_IDS = 100
+
+# Сколько изменений отдаёт /api/sync/ за один запрос.
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+# Через сколько секунд изменение попадает в /api/sync/. Должно быть больше
+# самой долгой транзакции, которая пишет рецепты, теги или ингредиенты.
+SYNC_TOKEN_LAG = int(os.getenv('SYNC_TOKEN_LAG', 30))
+
+# Период полураспада веса добавления в избранное или список покупок
+# для сортировок ?ordering=popular и ?ordering=trending, в секундах.
+RANKING_POPULAR_HALF_LIFE = 30 * 24 * 60 * 60
+RANKING_TRENDING_HALF_LIFE = 24 * 60 * 60
+
+# Вес добавления рецепта в рейтингах.
+RANKING_WEIGHTS = {
+    'favorite': 1.0,
+    'shopping': 0.5,
+}
+
+# Сколько похожих рецептов хранится для каждого рецепта.
+SIMILAR_RECIPES_COUNT = 10
+# Ингредиенты, которые есть в большем числе рецептов, не делают рецепты
+# похожими: по ним не ищутся кандидаты.
+SIMILAR_RECIPES_MAX_INGREDIENT_RECIPES = int(
+    os.getenv('SIMILAR_RECIPES_MAX_INGREDIENT_RECIPES', 1000))
+
+# Как часто индекс ингредиентов в памяти перестраивается целиком, чтобы
+# подхватить изменения, сделанные другими воркерами.
+INGREDIENT_INDEX_TIMEOUT = int(os.getenv('INGREDIENT_INDEX_TIMEOUT', 300))
+
 DJOSER = {
     'HIDE_USERS': False,
     "LOGIN_FIELD": "email",
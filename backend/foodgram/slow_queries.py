@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections, transaction
+from rest_framework.serializers import BaseSerializer
+
+from foodgram.streaming import wrap_streaming_content
+
+NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%s|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+_state = threading.local()
+_explained = set()
+_write_lock = threading.Lock()
+
+
+def normalize(sql):
+    """SQL без значений: числа и строки заменены на ?, списки IN — на ...
+
+    Запросы, различающиеся только параметрами, дают одинаковый текст.
+    """
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def get_call_site():
+    """Место вызова в коде проекта и метод сериализатора, если он есть."""
+    base_dir = str(settings.BASE_DIR)
+    code_line = serializer_method = None
+    frame = sys._getframe(2)
+    while frame is not None and (code_line is None
+                                 or serializer_method is None):
+        code = frame.f_code
+        if (code_line is None and code.co_filename.startswith(base_dir)
+                and code.co_filename != __file__):
+            path = os.path.relpath(code.co_filename, base_dir)
+            code_line = f'{path}:{frame.f_lineno} {code.co_name}'
+        instance = frame.f_locals.get('self')
+        if serializer_method is None and isinstance(instance, BaseSerializer):
+            serializer_method = f'{type(instance).__name__}.{code.co_name}'
+        frame = frame.f_back
+    return code_line, serializer_method
+
+
+def explain(alias, sql, params):
+    """План запроса или None, если его не удалось получить."""
+    connection = connections[alias]
+    prefix = connection.ops.explain_query_prefix()
+    _state.explaining = True
+    try:
+        with transaction.atomic(using=alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {sql}', params)
+                return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError:
+        return None
+    finally:
+        _state.explaining = False
+
+
+def write_entry(entry):
+    path = Path(settings.SLOW_QUERY_LOG)
+    line = json.dumps(entry, ensure_ascii=False) + '\n'
+    with _write_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if path.stat().st_size > settings.SLOW_QUERY_LOG_MAX_BYTES:
+                os.replace(path, f'{path}.1')
+        except FileNotFoundError:
+            pass
+        with open(path, 'a', encoding='utf-8') as log:
+            log.write(line)
+
+
+def read_entries():
+    """Записи журнала медленных запросов, начиная с более старых."""
+    path = Path(settings.SLOW_QUERY_LOG)
+    for log_path in (Path(f'{path}.1'), path):
+        if not log_path.exists():
+            continue
+        with open(log_path, encoding='utf-8') as log:
+            for line in log:
+                yield json.loads(line)
+
+
+class SlowQueryLogger:
+    """execute_wrapper, записывающий запросы дольше SLOW_QUERY_THRESHOLD."""
+    def __init__(self, alias, request):
+        self.alias = alias
+        self.request = request
+
+    def get_view(self):
+        match = self.request.resolver_match
+        view = match.view_name if match else self.request.path
+        return f'{self.request.method} {view}'
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_state, 'explaining', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - start) * 1000
+        if duration >= settings.SLOW_QUERY_THRESHOLD:
+            self.log(sql, params, many, duration)
+        return result
+
+    def log(self, sql, params, many, duration):
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        code_line, serializer_method = get_call_site()
+        plan = None
+        if (key not in _explained and not many
+                and normalized.upper().startswith('SELECT')):
+            _explained.add(key)
+            plan = explain(self.alias, sql, params)
+        write_entry({
+            'fingerprint': key,
+            'sql': normalized,
+            'time': duration,
+            'alias': self.alias,
+            'view': self.get_view(),
+            'code': code_line,
+            'serializer': serializer_method,
+            'plan': plan,
+            'logged': time.time(),
+        })
+
+
+class SlowQueryMiddleware:
+    """Пишет в SLOW_QUERY_LOG запросы к базе дольше порога.
+
+    Включается настройкой SLOW_QUERY_THRESHOLD в миллисекундах. Для каждого
+    запроса сохраняются нормализованный текст, его отпечаток, представление
+    и место вызова, а план EXPLAIN — один раз на отпечаток в процессе.
+    Запросы, которые выполняются при выдаче потокового ответа, тоже
+    записываются.
+    """
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        loggers = [SlowQueryLogger(alias, request) for alias in connections]
+
+        def log_queries():
+            stack = ExitStack()
+            for logger in loggers:
+                stack.enter_context(
+                    connections[logger.alias].execute_wrapper(logger))
+            return stack
+
+        with log_queries():
+            response = self.get_response(request)
+        if response.streaming:
+            wrap_streaming_content(response, log_queries)
+        return response
@@ -0,0 +1,50 @@
+import fcntl
+import hashlib
+import os
+import posixpath
+from contextlib import contextmanager
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — SHA-256 его содержимого.
+
+    Одинаковые файлы записываются один раз и используются всеми, кто их
+    загрузил. Повторная загрузка только обновляет время изменения файла,
+    чтобы reclaim_images не удалил его как давно неиспользуемый. Удалять
+    файл можно, только когда на него не ссылается ни одна запись, и только
+    под блокировкой lock(), которую берёт и save.
+    """
+    @contextmanager
+    def lock(self):
+        """Блокировка файлов хранилища, общая для всех процессов хоста.
+
+        Проверка существования файла и обновление его времени в save не
+        пересекаются с проверкой времени и удалением файла.
+        """
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        with self.lock():
+            if self.exists(name):
+                os.utime(self.path(name))
+                return name
+        return super().save(name, content, max_length)
@@ -0,0 +1,34 @@
+class ContextIterator:
+    """Итератор, получающий каждую часть ответа внутри context().
+
+    on_close вызывается один раз при закрытии ответа, даже если клиент
+    отключился, не дочитав его.
+    """
+    def __init__(self, iterable, context, on_close=None):
+        self.iterator = iter(iterable)
+        self.context = context
+        self.on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.context():
+            return next(self.iterator)
+
+    def close(self):
+        on_close, self.on_close = self.on_close, None
+        if on_close is not None:
+            on_close()
+
+
+def wrap_streaming_content(response, context, on_close=None):
+    """Выполняет выдачу тела потокового ответа внутри context().
+
+    Тело StreamingHttpResponse генерируется уже после выхода из middleware,
+    поэтому реплику, обёртки запросов к базе и профилировщик, которые
+    middleware включает на время запроса, нужно включать заново для каждой
+    части ответа.
+    """
+    response.streaming_content = ContextIterator(
+        response.streaming_content, context, on_close)
@@ -0,0 +1,45 @@
+from django.db import IntegrityError, connections, router, transaction
+
+
+def supports_insert_returning(connection):
+    return (connection.vendor in ('postgresql', 'sqlite')
+            and connection.features.can_return_columns_from_insert)
+
+
+def insert_ignore(model, **values):
+    """Добавляет строку, если она не нарушает уникальность.
+
+    На PostgreSQL и SQLite это один INSERT ... ON CONFLICT DO NOTHING
+    RETURNING. Возвращает True, если строка добавлена, и False, если
+    такая уже есть. Значения передаются по attname полей, например
+    recipe_id; остальные поля получают значения по умолчанию и auto_now_add,
+    как при save().
+    """
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    if not supports_insert_returning(connection):
+        try:
+            with transaction.atomic(using=alias):
+                model.objects.using(alias).create(**values)
+        except IntegrityError:
+            return False
+        return True
+
+    meta = model._meta
+    instance = model(**values)
+    fields = [field for field in meta.concrete_fields
+              if not field.primary_key]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    params = [
+        field.get_db_prep_save(field.pre_save(instance, True), connection)
+        for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders}) ON CONFLICT DO NOTHING '
+            f'RETURNING {quote(meta.pk.column)}',
+            params)
+        return cursor.fetchone() is not None
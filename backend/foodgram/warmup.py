@@ -0,0 +1,46 @@
+import importlib
+import inspect
+
+from django.db import connections
+from django.urls import get_resolver
+from rest_framework import serializers
+
+# Тяжёлые зависимости, которые в обычном процессе загружаются лениво.
+LAZY_MODULES = (
+    'reportlab.pdfgen.canvas',
+    'PIL.Image',
+    'recipes.similarity',
+    'recipes.ingredient_index',
+)
+
+
+def warm_up():
+    """Прогревает приложение в мастер-процессе gunicorn перед fork.
+
+    Воркеры получают уже разобранные URL, построенные поля сериализаторов
+    и загруженные тяжёлые модули через copy-on-write вместо того, чтобы
+    загружать их заново в каждом процессе. Индекс ингредиентов строится
+    здесь же, чтобы первые запросы воркеров его не ждали.
+    """
+    resolver = get_resolver()
+    resolver.reverse_dict
+
+    from api import serializers as api_serializers
+    from api.views import register_pdf_font
+
+    for _, serializer_class in inspect.getmembers(
+            api_serializers, inspect.isclass):
+        if (issubclass(serializer_class, serializers.Serializer)
+                and serializer_class.__module__ == api_serializers.__name__):
+            serializer_class().fields
+
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+    register_pdf_font()
+
+    from recipes.ingredient_index import ingredient_index
+
+    ingredient_index.build()
+
+    # Соединения с БД нельзя наследовать воркерам.
+    connections.close_all()
@@ -0,0 +1,16 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+# Приложение загружается один раз в мастер-процессе, воркеры получают его
+# через fork.
+preload_app = True
+
+
+def when_ready(server):
+    from foodgram.warmup import warm_up
+
+    warm_up()
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             Shopping, Tag)
@@ -14,19 +15,45 @@ admin.site.register(Ingredient, IngredientAdmin)
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
+    search_fields = ('name', 'slug')
 
 
 admin.site.register(Tag, TagAdmin)
 
 
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
-    list_filter = ('name', 'author', 'tags')
-    readonly_fields = ['favorite']
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    autocomplete_fields = ('ingredient',)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient')
+
 
+class RecipeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'author', 'favorite')
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'author__email')
+    autocomplete_fields = ('author',)
+    inlines = (RecipeIngredientInline,)
+    readonly_fields = ('favorite',)
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Коррелированный подзапрос считается только для строк страницы,
+        # а не группировкой по всей таблице избранного.
+        favorite_count = Favorite.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(count=Count('pk')).values('count')
+        return super().get_queryset(request).annotate(
+            favorite_count=Subquery(favorite_count))
+
+    @admin.display(description='Добавлено в избранное',
+                   ordering='favorite_count')
     def favorite(self, obj):
-        return obj.favorite.count()
-    favorite.short_description = 'Добавлено в избранное'
+        return obj.favorite_count or 0
 
 
 admin.site.register(Recipe, RecipeAdmin)
@@ -34,6 +61,10 @@ admin.site.register(Recipe, RecipeAdmin)
 
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
+    show_full_result_count = False
 
 
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
@@ -41,13 +72,17 @@ admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    search_fields = ('recipe__name', 'user__username', 'user__email')
+    autocomplete_fields = ('recipe', 'user')
+    show_full_result_count = False
 
 
 admin.site.register(Favorite, FavoriteAdmin)
 
 
-class ShoppingAdmin(admin.ModelAdmin):
-    list_display = ('recipe', 'user')
+class ShoppingAdmin(FavoriteAdmin):
+    pass
 
 
 admin.site.register(Shopping, ShoppingAdmin)
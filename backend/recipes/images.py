@@ -0,0 +1,110 @@
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+
+from recipes.models import OrphanedImage, Recipe
+
+
+def get_image_storage():
+    field = Recipe._meta.get_field('image')
+    return field.storage, field.upload_to
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def unused(names):
+    """Имена из names, на которые не ссылается ни один рецепт."""
+    used = set(Recipe.objects.filter(
+        image__in=names).values_list('image', flat=True))
+    return [name for name in names if name not in used]
+
+
+def recently_saved(storage, name, cutoff):
+    try:
+        return storage.get_modified_time(name).timestamp() >= cutoff
+    except FileNotFoundError:
+        return False
+
+
+def delete_unless_saved(storage, name, cutoff):
+    """Удаляет файл, если он не сохранялся повторно после cutoff.
+
+    Проверка и удаление идут под блокировкой хранилища, поэтому
+    одновременная загрузка того же изображения не останется без файла:
+    она либо обновит время файла до проверки, либо запишет его заново.
+    Возвращает True, если файл удалён.
+    """
+    with storage.lock():
+        if recently_saved(storage, name, cutoff):
+            return False
+        storage.delete(name)
+    return True
+
+
+def reclaim_queued(batch_size=500, dry_run=False):
+    """Удаляет файлы из очереди OrphanedImage пачками по batch_size.
+
+    Файл удаляется, только если на него не ссылается ни один рецепт.
+    Одинаковые изображения хранятся одним файлом, поэтому недавно
+    загруженный повторно файл остаётся в очереди до следующего запуска:
+    рецепт с ним может быть ещё не сохранён. Возвращает число удалённых
+    файлов.
+    """
+    storage, _ = get_image_storage()
+    cutoff = time.time() - settings.ORPHANED_IMAGE_GRACE_PERIOD
+    deleted = 0
+    last_id = 0
+    while batch := list(OrphanedImage.objects.filter(
+        id__gt=last_id
+    ).values_list('id', 'name')[:batch_size]):
+        last_id = batch[-1][0]
+        kept = set()
+        for name in unused(list({name for _, name in batch})):
+            if dry_run:
+                if recently_saved(storage, name, cutoff):
+                    kept.add(name)
+                else:
+                    deleted += 1
+            elif delete_unless_saved(storage, name, cutoff):
+                deleted += 1
+            else:
+                kept.add(name)
+        if not dry_run:
+            OrphanedImage.objects.filter(id__in=[
+                id for id, name in batch if name not in kept]).delete()
+    return deleted
+
+
+def iter_stored_images(grace_period):
+    """Файлы каталога изображений старше grace_period секунд.
+
+    Каталог читается потоком через os.scandir, поэтому память не зависит
+    от числа файлов.
+    """
+    storage, directory = get_image_storage()
+    cutoff = time.time() - grace_period
+    try:
+        entries = os.scandir(storage.path(directory))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                yield f'{directory}/{entry.name}'
+
+
+def find_orphans(batch_size=500, grace_period=None):
+    """Файлы в каталоге изображений, на которые не ссылаются рецепты.
+
+    Недавние файлы пропускаются: рецепт с ними может быть ещё не сохранён.
+    """
+    if grace_period is None:
+        grace_period = settings.ORPHANED_IMAGE_GRACE_PERIOD
+    for names in chunked(iter_stored_images(grace_period), batch_size):
+        yield from unused(names)
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+from recipes.models import RecipeIngredient
+from recipes.similarity import SparseBinaryMatrix
+
+logger = logging.getLogger(__name__)
+
+
+class IngredientIndex:
+    """Инвертированный индекс ингредиент → рецепты в памяти процесса.
+
+    Списки рецептов хранятся отсортированными массивами numpy, число
+    ингредиентов каждого рецепта — плотным массивом по id рецепта.
+    Индекс строится при прогреве мастер-процесса gunicorn или лениво при
+    первом запросе и поддерживается сигналами RecipeIngredient. Изменения
+    из других процессов подхватываются полной перестройкой не реже раза
+    в INGREDIENT_INDEX_TIMEOUT секунд. Перестройка идёт в фоновом потоке,
+    а запросы тем временем обслуживает прежний индекс.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._rebuilding = False
+        self._pending = None
+
+    def build(self):
+        """Строит индекс заново и подменяет им текущий.
+
+        Рецепты, изменённые во время построения, после подмены
+        перечитываются из базы: новый индекс мог их не застать.
+        """
+        with self._lock:
+            self._pending = set()
+        pairs = np.array(
+            RecipeIngredient.objects.values_list('recipe_id', 'ingredient_id'),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        by_recipe = SparseBinaryMatrix(pairs[:, 0], pairs[:, 1])
+        by_ingredient = by_recipe.transpose()
+        sizes = np.bincount(pairs[:, 0]).astype(np.int32)
+        with self._lock:
+            self._by_recipe = by_recipe
+            self._by_ingredient = by_ingredient
+            self._sizes = sizes
+            self._postings = {}
+            self._changed = {}
+            self._built_at = time.monotonic()
+            pending, self._pending = self._pending, None
+            ingredients = {recipe_id: set() for recipe_id in pending}
+            for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                    recipe_id__in=pending).values_list(
+                        'recipe_id', 'ingredient_id'):
+                ingredients[recipe_id].add(ingredient_id)
+            for recipe_id, ingredient_ids in ingredients.items():
+                self._set(recipe_id, ingredient_ids)
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс ингредиентов')
+        finally:
+            self._rebuilding = False
+            connections.close_all()
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            self.build()
+        elif (not self._rebuilding and time.monotonic() - self._built_at
+                > settings.INGREDIENT_INDEX_TIMEOUT):
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _ingredients(self, recipe_id):
+        ingredient_ids = self._changed.get(recipe_id)
+        if ingredient_ids is None:
+            ingredient_ids = set(self._by_recipe.row(recipe_id).tolist())
+        return ingredient_ids
+
+    def _posting(self, ingredient_id):
+        posting = self._postings.get(ingredient_id)
+        if posting is None:
+            posting = self._by_ingredient.row(ingredient_id)
+        return posting
+
+    def _set(self, recipe_id, ingredient_ids):
+        old = self._ingredients(recipe_id)
+        for ingredient_id in old - ingredient_ids:
+            posting = self._posting(ingredient_id)
+            self._postings[ingredient_id] = posting[posting != recipe_id]
+        for ingredient_id in ingredient_ids - old:
+            self._postings[ingredient_id] = np.union1d(
+                self._posting(ingredient_id), [recipe_id])
+        self._changed[recipe_id] = set(ingredient_ids)
+        if self._pending is not None:
+            self._pending.add(recipe_id)
+        if recipe_id >= len(self._sizes):
+            sizes = np.zeros(2 * recipe_id + 1, dtype=np.int32)
+            sizes[:len(self._sizes)] = self._sizes
+            self._sizes = sizes
+        self._sizes[recipe_id] = len(ingredient_ids)
+
+    def add(self, recipe_id, ingredient_id):
+        with self._lock:
+            if self._built_at is not None:
+                self._set(recipe_id,
+                          self._ingredients(recipe_id) | {ingredient_id})
+
+    def discard(self, recipe_id, ingredient_id):
+        with self._lock:
+            if self._built_at is not None:
+                self._set(recipe_id,
+                          self._ingredients(recipe_id) - {ingredient_id})
+
+    def reload_recipe(self, recipe_id):
+        with self._lock:
+            if self._built_at is not None:
+                self._set(recipe_id, set(RecipeIngredient.objects.filter(
+                    recipe_id=recipe_id
+                ).values_list('ingredient_id', flat=True)))
+
+    def search(self, ingredient_ids, min_coverage=0):
+        """Рецепты, которые можно приготовить из ingredient_ids.
+
+        Возвращает id рецептов и долю их ингредиентов, которая есть
+        в наличии, по убыванию этой доли.
+        """
+        with self._lock:
+            self._ensure_built()
+            postings = [self._posting(ingredient_id)
+                        for ingredient_id in set(ingredient_ids)]
+            sizes = self._sizes
+        if not postings:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        recipe_ids, covered = np.unique(np.concatenate(postings),
+                                        return_counts=True)
+        coverage = covered / sizes[recipe_ids]
+        matches = coverage >= min_coverage
+        recipe_ids, coverage = recipe_ids[matches], coverage[matches]
+        order = np.lexsort((-recipe_ids, -coverage))
+        return recipe_ids[order], coverage[order]
+
+
+ingredient_index = IngredientIndex()
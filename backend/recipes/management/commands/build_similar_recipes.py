@@ -0,0 +1,31 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.similarity import apply_pending, rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты для всего каталога, а с '
+            '--pending только выполняет отложенные обновления.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int,
+                            help='Сколько похожих рецептов хранить.')
+        parser.add_argument('--pending', action='store_true',
+                            help='Выполнить обновления, которые не успели '
+                                 'выполнить воркеры.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['pending']:
+            done = apply_pending()
+            self.stdout.write(self.style.SUCCESS(
+                f'Отложенных обновлений выполнено: {done} за '
+                f'{time.perf_counter() - start:.1f} с'))
+            return
+        total = rebuild_similar_recipes(options['count'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны для {total} рецептов '
+            f'за {time.perf_counter() - start:.1f} с')
+        )
@@ -0,0 +1,80 @@
+import json
+import sys
+import time
+
+from django.core.management import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+def export_recipe(recipe):
+    author = recipe.author
+    return {
+        'id': recipe.id,
+        'author': author and {
+            'email': author.email,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+        },
+        'name': recipe.name,
+        'image': recipe.image.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'tags': [
+            {'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+            for tag in recipe.tags.all()
+        ],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipe_ingredient.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с авторами, тегами и ингредиентами в JSONL. '
+            'Файлы изображений копируются отдельно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки, "-" — stdout.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        recipes = Recipe.objects.order_by('id').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredient',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient').order_by('pk')),
+        )
+        output = (sys.stdout if options['path'] == '-'
+                  else open(options['path'], 'w', encoding='utf-8'))
+        start = time.perf_counter()
+        total = 0
+        try:
+            for recipe in recipes.iterator(chunk_size=chunk_size):
+                output.write(json.dumps(export_recipe(recipe),
+                                        ensure_ascii=False) + '\n')
+                total += 1
+                if total % chunk_size == 0:
+                    self.report(total, start)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.report(total, start)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {total}'))
+
+    def report(self, total, start):
+        elapsed = time.perf_counter() - start
+        self.stderr.write(
+            f'{total} рецептов, {total / max(elapsed, 1e-9):.0f} рецептов/с')
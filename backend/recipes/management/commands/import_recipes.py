@@ -0,0 +1,182 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.models import Change, Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из JSONL, созданного export_recipes. '
+            'Каждая пачка записей загружается в отдельной транзакции, '
+            'номер последней загруженной строки сохраняется в '
+            '<файл>.progress для продолжения с --resume. Рецепты, которые '
+            'уже есть с тем же автором, названием и датой публикации, '
+            'пропускаются, поэтому повторная загрузка пачки безопасна.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить с места остановки.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        progress_path = f'{path}.progress'
+        chunk_size = options['chunk_size']
+        done = 0
+        if options['resume'] and os.path.exists(progress_path):
+            with open(progress_path) as progress:
+                done = int(progress.read())
+
+        self.ingredients = {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit')
+        }
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+
+        start = time.perf_counter()
+        imported = 0
+        with open(path, encoding='utf-8') as source:
+            lines = islice(source, done, None)
+            while True:
+                chunk = list(islice(lines, chunk_size))
+                if not chunk:
+                    break
+                try:
+                    records = [json.loads(line) for line in chunk]
+                except json.JSONDecodeError as error:
+                    raise CommandError(
+                        f'Ошибка в строке {done + 1}..{done + len(chunk)}: '
+                        f'{error}')
+                with transaction.atomic():
+                    imported += self.import_chunk(records)
+                done += len(chunk)
+                with open(progress_path, 'w') as progress:
+                    progress.write(str(done))
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{done} строк, {imported / max(elapsed, 1e-9):.0f} '
+                    f'рецептов/с')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported}. Пересчитайте похожие рецепты '
+            f'командой build_similar_recipes и карточки командой '
+            f'rebuild_recipe_cards.'))
+
+    def get_authors(self, records):
+        authors = {record['author']['email']: record['author']
+                   for record in records if record['author']}
+        existing = dict(User.objects.filter(
+            email__in=authors).values_list('email', 'pk'))
+        missing = [author for email, author in authors.items()
+                   if email not in existing]
+        usernames = [author['username'] for author in missing]
+        taken = set(User.objects.filter(
+            username__in=usernames).values_list('username', flat=True))
+        taken.update(username for username in usernames
+                     if usernames.count(username) > 1)
+        if taken:
+            raise CommandError(
+                f'Имена пользователей заняты авторами с другой почтой: '
+                f'{", ".join(sorted(taken))}')
+        users = []
+        for author in missing:
+            user = User(**author)
+            user.set_unusable_password()
+            users.append(user)
+        for user in User.objects.bulk_create(users):
+            existing[user.email] = user.pk
+        return existing
+
+    def get_tags(self, records):
+        missing = {}
+        for record in records:
+            for tag in record['tags']:
+                if tag['slug'] not in self.tags:
+                    missing[tag['slug']] = Tag(**tag)
+        for tag in Tag.objects.bulk_create(missing.values()):
+            self.tags[tag.slug] = tag.pk
+        Change.record_many(Change.TAG, [tag.pk for tag in missing.values()])
+
+    def get_ingredients(self, records):
+        missing = {}
+        for record in records:
+            for item in record['ingredients']:
+                key = (item['name'], item['measurement_unit'])
+                if key not in self.ingredients:
+                    missing[key] = Ingredient(
+                        name=item['name'],
+                        measurement_unit=item['measurement_unit'])
+        for ingredient in Ingredient.objects.bulk_create(missing.values()):
+            self.ingredients[(ingredient.name,
+                              ingredient.measurement_unit)] = ingredient.pk
+        Change.record_many(Change.INGREDIENT,
+                           [ingredient.pk for ingredient in missing.values()])
+
+    def skip_imported(self, records, authors):
+        """Записи без рецептов, уже загруженных раньше.
+
+        Пачка фиксируется до записи номера строки в .progress, поэтому
+        после сбоя между ними --resume загружает её повторно.
+        """
+        keys = [
+            (authors[record['author']['email']] if record['author'] else None,
+             record['name'], parse_datetime(record['pub_date']))
+            for record in records
+        ]
+        imported = set(Recipe.objects.filter(
+            name__in={name for _, name, _ in keys},
+            pub_date__in={pub_date for _, _, pub_date in keys},
+        ).values_list('author_id', 'name', 'pub_date'))
+        return [record for record, key in zip(records, keys)
+                if key not in imported]
+
+    def import_chunk(self, records):
+        authors = self.get_authors(records)
+        records = self.skip_imported(records, authors)
+        if not records:
+            return 0
+        self.get_tags(records)
+        self.get_ingredients(records)
+
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author_id=(authors[record['author']['email']]
+                           if record['author'] else None),
+                name=record['name'],
+                image=record['image'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+            )
+            for record in records
+        )
+        # auto_now_add перезаписывает дату публикации при создании.
+        for recipe, record in zip(recipes, records):
+            recipe.pub_date = parse_datetime(record['pub_date'])
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk,
+                                tag_id=self.tags[tag['slug']])
+            for recipe, record in zip(recipes, records)
+            for tag in record['tags']
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe.pk,
+                ingredient_id=self.ingredients[
+                    (item['name'], item['measurement_unit'])],
+                amount=item['amount'],
+            )
+            for recipe, record in zip(recipes, records)
+            for item in record['ingredients']
+        )
+        # bulk_create не отправляет сигналы, которые ведут ленту /api/sync/.
+        Change.record_many(Change.RECIPE, [recipe.pk for recipe in recipes])
+        return len(recipes)
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.images import (chunked, delete_unless_saved, find_orphans,
+                            get_image_storage, reclaim_queued)
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения, заменённые или оставшиеся от удалённых '
+            'рецептов, а с --sweep ищет в каталоге файлы без рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sweep', action='store_true',
+                            help='Проверить все файлы каталога изображений.')
+        parser.add_argument('--grace-period', type=int,
+                            help='Не трогать файлы моложе стольких секунд.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        deleted = reclaim_queued(batch_size, dry_run)
+        self.stdout.write(f'Удалено файлов из очереди: {deleted}')
+        if not options['sweep']:
+            return
+
+        storage, _ = get_image_storage()
+        grace_period = options['grace_period']
+        if grace_period is None:
+            grace_period = settings.ORPHANED_IMAGE_GRACE_PERIOD
+        orphans = 0
+        for names in chunked(find_orphans(
+                batch_size, grace_period), batch_size):
+            # Файл мог быть загружен заново после того, как его нашли.
+            cutoff = time.time() - grace_period
+            for name in names:
+                if dry_run:
+                    self.stdout.write(name)
+                    orphans += 1
+                elif delete_unless_saved(storage, name, cutoff):
+                    orphans += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов без рецептов: {orphans}'))
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from recipes.rankings import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = ('Обновляет рейтинги рецептов для сортировок ?ordering=popular '
+            'и ?ordering=trending. Запускается периодически, например '
+            'из cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать рейтинги по всем событиям.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        updated = refresh_rankings(options['full'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлены рейтинги рецептов: {updated}'))
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.2 on 2026-10-19 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrphanedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Файл')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Добавлен в очередь')),
+            ],
+            options={
+                'verbose_name': 'Неиспользуемое изображение',
+                'verbose_name_plural': 'Неиспользуемые изображения',
+                'ordering': ('id',),
+            },
+        ),
+    ]
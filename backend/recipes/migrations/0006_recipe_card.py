@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-19 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_orphanedimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='card',
+            field=models.JSONField(blank=True, editable=False, help_text='Общая для всех пользователей часть представления.', null=True, verbose_name='Карточка'),
+        ),
+    ]
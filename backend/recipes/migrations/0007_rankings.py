@@ -0,0 +1,53 @@
+# Generated by Django 4.2.2 on 2026-10-19 21:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_created(apps, schema_editor):
+    # Время добавления прежних записей неизвестно. Берётся дата публикации
+    # рецепта, иначе все они выглядели бы только что добавленными и подняли
+    # бы старые рецепты в «популярное за последнее время».
+    Recipe = apps.get_model('recipes', 'Recipe')
+    pub_date = Subquery(Recipe.objects.filter(
+        pk=OuterRef('recipe_id')).values('pub_date')[:1])
+    for name in ('Favorite', 'Shopping'):
+        apps.get_model('recipes', name).objects.update(created=pub_date)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_card'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shopping',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_created, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(db_index=True, default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(db_index=True, default=0, verbose_name='Популярность за последнее время')),
+                ('updated', models.DateTimeField(verbose_name='Время расчёта')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+    ]
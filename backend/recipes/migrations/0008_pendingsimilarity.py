@@ -0,0 +1,26 @@
+# Generated by Django 4.2.2 on 2026-10-20 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_rankings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(verbose_name='id рецепта')),
+                ('list_only', models.BooleanField(default=False, verbose_name='Только список самого рецепта')),
+            ],
+            options={
+                'verbose_name': 'Отложенное обновление похожих рецептов',
+                'verbose_name_plural': 'Отложенные обновления похожих рецептов',
+                'ordering': ('id',),
+            },
+        ),
+    ]
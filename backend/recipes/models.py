@@ -91,6 +91,13 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    card = models.JSONField(
+        verbose_name='Карточка',
+        help_text='Общая для всех пользователей часть представления.',
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ['-pub_date']
@@ -180,6 +187,11 @@ class Favorite(models.Model):
         verbose_name='Рецепт',
         related_name='favorite_list'
     )
+    created = models.DateTimeField(
+        verbose_name='Добавлен',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Список избранного'
@@ -209,6 +221,11 @@ class Shopping(models.Model):
         verbose_name='Рецепт',
         related_name='shopping_list'
     )
+    created = models.DateTimeField(
+        verbose_name='Добавлен',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -222,3 +239,175 @@ class Shopping(models.Model):
 
     def __str__(self):
         return f'{self.recipe} - {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт по пересечению ингредиентов и тегов."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='similar_to'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+
+    class Meta:
+        ordering = ('-score',)
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique similar recipe'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}'
+
+
+class PendingSimilarity(models.Model):
+    """Рецепт, похожие рецепты которого нужно обновить.
+
+    Запись создаётся в транзакции изменения рецепта и удаляется после
+    обновления, поэтому обновления, которые не успел выполнить
+    остановленный воркер, не теряются.
+    """
+    recipe_id = models.PositiveBigIntegerField(
+        verbose_name='id рецепта'
+    )
+    list_only = models.BooleanField(
+        verbose_name='Только список самого рецепта',
+        default=False
+    )
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Отложенное обновление похожих рецептов'
+        verbose_name_plural = 'Отложенные обновления похожих рецептов'
+
+    def __str__(self):
+        return str(self.recipe_id)
+
+
+class Change(models.Model):
+    """Последнее изменение объекта для синхронизации клиентов.
+
+    На каждый объект хранится одна запись: при новом изменении старая
+    удаляется, а id новой записи служит токеном синхронизации.
+    """
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    RECIPE = 'recipe'
+    MODELS = (
+        (TAG, 'Тег'),
+        (INGREDIENT, 'Ингредиент'),
+        (RECIPE, 'Рецепт'),
+    )
+    model = models.CharField(
+        verbose_name='Модель',
+        max_length=15,
+        choices=MODELS
+    )
+    object_id = models.PositiveBigIntegerField(
+        verbose_name='id объекта'
+    )
+    deleted = models.BooleanField(
+        verbose_name='Удалён',
+        default=False
+    )
+    created = models.DateTimeField(
+        verbose_name='Время изменения',
+        auto_now_add=True
+    )
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Изменения'
+        indexes = (
+            models.Index(fields=('model', 'object_id')),
+        )
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+    @classmethod
+    def record(cls, model, object_id, deleted=False):
+        cls.objects.filter(model=model, object_id=object_id).delete()
+        cls.objects.create(model=model, object_id=object_id, deleted=deleted)
+
+    @classmethod
+    def record_many(cls, model, object_ids):
+        object_ids = list(object_ids)
+        cls.objects.filter(model=model, object_id__in=object_ids).delete()
+        cls.objects.bulk_create(cls(model=model, object_id=object_id)
+                                for object_id in object_ids)
+
+
+class OrphanedImage(models.Model):
+    """Файл изображения, который больше не нужен рецепту.
+
+    Файлы удаляются пачками командой reclaim_images, если на них
+    не ссылается ни один рецепт.
+    """
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=255
+    )
+    created = models.DateTimeField(
+        verbose_name='Добавлен в очередь',
+        auto_now_add=True
+    )
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Неиспользуемое изображение'
+        verbose_name_plural = 'Неиспользуемые изображения'
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeRanking(models.Model):
+    """Рейтинги рецепта по добавлениям в избранное и список покупок.
+
+    Каждое добавление весит тем меньше, чем оно старше: вклад в popular
+    уменьшается вдвое за RANKING_POPULAR_HALF_LIFE, в trending — за
+    RANKING_TRENDING_HALF_LIFE. Пересчитывается командой update_rankings.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='ranking'
+    )
+    popular = models.FloatField(
+        verbose_name='Популярность',
+        default=0,
+        db_index=True
+    )
+    trending = models.FloatField(
+        verbose_name='Популярность за последнее время',
+        default=0,
+        db_index=True
+    )
+    updated = models.DateTimeField(
+        verbose_name='Время расчёта'
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return f'{self.recipe}: {self.popular:.2f} / {self.trending:.2f}'
@@ -0,0 +1,93 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from foodgram.response_cache import invalidate_responses
+from recipes.models import Favorite, RecipeRanking, Shopping
+
+EVENT_MODELS = {
+    'favorite': Favorite,
+    'shopping': Shopping,
+}
+
+
+def decay(seconds, half_life):
+    """Во сколько раз уменьшается вес события за seconds секунд."""
+    return 0.5 ** (max(seconds, 0) / half_life)
+
+
+def collect_scores(now, since=None, batch_size=2000):
+    """Вклад добавлений после since в рейтинги на момент now.
+
+    Возвращает {recipe_id: [popular, trending]}.
+    """
+    popular_half_life = settings.RANKING_POPULAR_HALF_LIFE
+    trending_half_life = settings.RANKING_TRENDING_HALF_LIFE
+    scores = defaultdict(lambda: [0.0, 0.0])
+    for name, model in EVENT_MODELS.items():
+        weight = settings.RANKING_WEIGHTS[name]
+        events = model.objects.filter(created__lte=now)
+        if since is not None:
+            events = events.filter(created__gt=since)
+        for recipe_id, created in events.values_list(
+                'recipe_id', 'created').iterator(chunk_size=batch_size):
+            age = (now - created).total_seconds()
+            score = scores[recipe_id]
+            score[0] += weight * decay(age, popular_half_life)
+            score[1] += weight * decay(age, trending_half_life)
+    return scores
+
+
+@transaction.atomic
+def refresh_rankings(full=False, batch_size=2000):
+    """Пересчитывает рейтинги RecipeRanking.
+
+    Обычный запуск уменьшает сохранённые рейтинги на время с прошлого
+    расчёта и добавляет к ним только новые события. Удаления из избранного
+    и списка покупок учитывает только полный пересчёт (full=True), поэтому
+    его стоит запускать реже, например раз в сутки.
+    Возвращает количество рецептов, рейтинги которых изменились.
+    """
+    now = timezone.now()
+    # Рейтинги меняют порядок в кэшированных списках ?ordering=.
+    invalidate_responses()
+    last = None
+    if not full:
+        last = RecipeRanking.objects.aggregate(last=Max('updated'))['last']
+    if last is None:
+        RecipeRanking.objects.all().delete()
+        scores = collect_scores(now, batch_size=batch_size)
+        RecipeRanking.objects.bulk_create((
+            RecipeRanking(recipe_id=recipe_id, popular=popular,
+                          trending=trending, updated=now)
+            for recipe_id, (popular, trending) in scores.items()
+        ), batch_size=batch_size)
+        return len(scores)
+
+    elapsed = (now - last).total_seconds()
+    RecipeRanking.objects.update(
+        popular=F('popular') * decay(
+            elapsed, settings.RANKING_POPULAR_HALF_LIFE),
+        trending=F('trending') * decay(
+            elapsed, settings.RANKING_TRENDING_HALF_LIFE),
+        updated=now,
+    )
+    scores = collect_scores(now, last, batch_size)
+    rankings = RecipeRanking.objects.in_bulk(list(scores))
+    created = []
+    for recipe_id, (popular, trending) in scores.items():
+        ranking = rankings.get(recipe_id)
+        if ranking is None:
+            created.append(RecipeRanking(
+                recipe_id=recipe_id, popular=popular, trending=trending,
+                updated=now))
+            continue
+        ranking.popular += popular
+        ranking.trending += trending
+    RecipeRanking.objects.bulk_create(created, batch_size=batch_size)
+    RecipeRanking.objects.bulk_update(
+        rankings.values(), ('popular', 'trending'), batch_size=batch_size)
+    return len(scores)
@@ -0,0 +1,117 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+
+from recipes.models import (Change, Ingredient, OrphanedImage, Recipe,
+                            RecipeIngredient, SimilarRecipe, Tag)
+
+# Отправляется после того, как у рецепта заменены теги и ингредиенты.
+# Аргументы: recipe.
+recipe_contents_changed = Signal()
+
+SYNCED_MODELS = {
+    Tag: Change.TAG,
+    Ingredient: Change.INGREDIENT,
+    Recipe: Change.RECIPE,
+}
+
+
+@receiver(recipe_contents_changed)
+def update_similar_recipes(sender, recipe, **kwargs):
+    from recipes.similarity import schedule
+
+    schedule([recipe.pk])
+
+
+# Строки похожих рецептов удаляются каскадом, поэтому рецепты, в списках
+# которых был удалённый, запоминаются до удаления и пересчитываются.
+
+@receiver(pre_delete, sender=Recipe)
+def remember_similar_holders(sender, instance, **kwargs):
+    instance._similar_holders = list(SimilarRecipe.objects.filter(
+        similar_id=instance.pk).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def refresh_similar_holders(sender, instance, **kwargs):
+    from recipes.similarity import schedule
+
+    holders = getattr(instance, '_similar_holders', ())
+    if holders:
+        schedule(holders, list_only=True)
+
+
+@receiver(recipe_contents_changed)
+def reload_ingredient_index(sender, recipe, **kwargs):
+    from recipes.ingredient_index import ingredient_index
+
+    transaction.on_commit(lambda: ingredient_index.reload_recipe(recipe.pk))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_to_ingredient_index(sender, instance, **kwargs):
+    from recipes.ingredient_index import ingredient_index
+
+    transaction.on_commit(lambda: ingredient_index.add(
+        instance.recipe_id, instance.ingredient_id))
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_from_ingredient_index(sender, instance, **kwargs):
+    from recipes.ingredient_index import ingredient_index
+
+    transaction.on_commit(lambda: ingredient_index.discard(
+        instance.recipe_id, instance.ingredient_id))
+
+
+def record_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Change.record(SYNCED_MODELS[sender], instance.pk)
+
+
+def record_deletion(sender, instance, **kwargs):
+    Change.record(SYNCED_MODELS[sender], instance.pk, deleted=True)
+
+
+# Обработчики подключаются только к синхронизируемым моделям: обработчик
+# post_delete без sender отключил бы быстрое удаление для всех моделей.
+# Изменения рецептов, в том числе их тегов, ингредиентов и авторов,
+# записывает обновление карточек в api.cards, здесь — только удаление.
+for model in SYNCED_MODELS:
+    if model is not Recipe:
+        post_save.connect(record_change, sender=model)
+    post_delete.connect(record_deletion, sender=model)
+
+
+def queue_orphaned_image(name):
+    # Файл ставится в очередь только после фиксации транзакции: при
+    # откате рецепт продолжает на него ссылаться.
+    transaction.on_commit(lambda: OrphanedImage.objects.create(name=name))
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_replaced_image(sender, instance, raw=False, update_fields=None,
+                            **kwargs):
+    instance._replaced_image = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    instance._replaced_image = Recipe.objects.filter(
+        pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def queue_replaced_image(sender, instance, **kwargs):
+    # Имя нового файла известно только после сохранения: при одинаковом
+    # содержимом хранилище оставляет прежний файл.
+    old_name = getattr(instance, '_replaced_image', None)
+    if old_name and old_name != instance.image.name:
+        queue_orphaned_image(old_name)
+
+
+@receiver(post_delete, sender=Recipe)
+def queue_deleted_image(sender, instance, **kwargs):
+    if instance.image.name:
+        queue_orphaned_image(instance.image.name)
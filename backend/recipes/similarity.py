@@ -0,0 +1,313 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count
+
+from recipes.models import (PendingSimilarity, Recipe, RecipeIngredient,
+                            SimilarRecipe)
+
+logger = logging.getLogger(__name__)
+
+INGREDIENT_WEIGHT = 0.8
+TAG_WEIGHT = 0.2
+
+
+class SparseBinaryMatrix:
+    """Бинарная разреженная матрица, хранящая строки в формате CSR.
+
+    keys — отсортированные ключи непустых строк, cols — столбцы всех строк
+    подряд, starts и sizes — начало и длина каждой строки в cols.
+    """
+    def __init__(self, rows, cols):
+        order = np.lexsort((cols, rows))
+        rows = rows[order]
+        self.cols = cols[order]
+        self.keys, self.starts, self.sizes = np.unique(
+            rows, return_index=True, return_counts=True)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        return cls(pairs[:, 0], pairs[:, 1])
+
+    def transpose(self):
+        return SparseBinaryMatrix(
+            self.cols, np.repeat(self.keys, self.sizes))
+
+    def _find(self, keys):
+        """Позиции ключей в self.keys и маска найденных ключей."""
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        return positions, found
+
+    def sizes_of(self, keys):
+        positions, found = self._find(keys)
+        sizes = np.zeros(len(keys), dtype=np.int64)
+        sizes[found] = self.sizes[positions[found]]
+        return sizes
+
+    def row(self, key):
+        return self.rows(np.array([key]))[1]
+
+    def rows(self, keys):
+        """Столбцы строк keys и номер строки в keys для каждого столбца."""
+        positions, found = self._find(keys)
+        sizes = np.zeros(len(keys), dtype=np.int64)
+        sizes[found] = self.sizes[positions[found]]
+        starts = np.zeros(len(keys), dtype=np.int64)
+        starts[found] = self.starts[positions[found]]
+        owners = np.repeat(np.arange(len(keys)), sizes)
+        offsets = np.arange(sizes.sum()) - np.repeat(
+            np.cumsum(sizes) - sizes, sizes)
+        return owners, self.cols[np.repeat(starts, sizes) + offsets]
+
+
+class SimilarityIndex:
+    """Матрицы рецепт×ингредиент и рецепт×тег для расчёта сходства.
+
+    common — ингредиенты, которые есть почти во всех рецептах (соль,
+    вода): общий такой ингредиент сам по себе не делает рецепты похожими,
+    поэтому кандидаты ищутся только по остальным.
+    """
+    def __init__(self, ingredient_pairs, tag_pairs, common):
+        self.ingredients = SparseBinaryMatrix.from_pairs(ingredient_pairs)
+        self.recipes_by_ingredient = self.ingredients.transpose()
+        self.tags = SparseBinaryMatrix.from_pairs(tag_pairs)
+        self.common = np.array(sorted(common), dtype=np.int64)
+
+    @classmethod
+    def load(cls, recipe_ids=None):
+        """Загружает матрицы для всех рецептов или только для recipe_ids."""
+        ingredients = RecipeIngredient.objects.all()
+        tags = Recipe.tags.through.objects.all()
+        if recipe_ids is not None:
+            ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+            tags = tags.filter(recipe_id__in=recipe_ids)
+        return cls(
+            list(ingredients.values_list('recipe_id', 'ingredient_id')),
+            list(tags.values_list('recipe_id', 'tag_id')),
+            get_common_ingredients(),
+        )
+
+    @property
+    def recipe_ids(self):
+        return self.ingredients.keys
+
+    def scores(self, recipe_id):
+        """Рецепты с общими не частыми ингредиентами и их сходство.
+
+        Сходство — взвешенная сумма коэффициентов Жаккара по ингредиентам
+        и по тегам.
+        """
+        ingredients = self.ingredients.row(recipe_id)
+        _, candidates = self.recipes_by_ingredient.rows(
+            ingredients[~np.isin(ingredients, self.common)])
+        ids, common = np.unique(candidates, return_counts=True)
+        other = ids != recipe_id
+        ids, common = ids[other], common[other]
+        ingredient_score = common / (
+            len(ingredients) + self.ingredients.sizes_of(ids) - common)
+
+        tags = self.tags.row(recipe_id)
+        owners, candidate_tags = self.tags.rows(ids)
+        common_tags = np.bincount(
+            owners, weights=np.isin(candidate_tags, tags),
+            minlength=len(ids))
+        union = len(tags) + self.tags.sizes_of(ids) - common_tags
+        tag_score = np.divide(common_tags, union,
+                              out=np.zeros(len(ids)), where=union > 0)
+        return ids, (INGREDIENT_WEIGHT * ingredient_score
+                     + TAG_WEIGHT * tag_score)
+
+    def top(self, recipe_id, count):
+        return select_top(*self.scores(recipe_id), count)
+
+
+def select_top(ids, scores, count):
+    """Не больше count самых похожих рецептов по убыванию сходства."""
+    if len(ids) > count:
+        best = np.argpartition(-scores, count - 1)[:count]
+        ids, scores = ids[best], scores[best]
+    order = np.lexsort((ids, -scores))
+    return ids[order], scores[order]
+
+
+def rebuild_similar_recipes(count=None, batch_size=1000):
+    """Полностью пересчитывает таблицу похожих рецептов."""
+    count = count or settings.SIMILAR_RECIPES_COUNT
+    index = SimilarityIndex.load()
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        batch = []
+        for recipe_id in index.recipe_ids.tolist():
+            ids, scores = index.top(recipe_id, count)
+            batch.extend(
+                SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                              score=score)
+                for similar_id, score in zip(ids.tolist(), scores.tolist()))
+            if len(batch) >= batch_size:
+                SimilarRecipe.objects.bulk_create(batch)
+                batch = []
+        SimilarRecipe.objects.bulk_create(batch)
+    return len(index.recipe_ids)
+
+
+def get_common_ingredients():
+    """Ингредиенты, которые есть больше чем в
+    SIMILAR_RECIPES_MAX_INGREDIENT_RECIPES рецептах.
+
+    Список меняется медленно, поэтому хранится в кэше час.
+    """
+    common = cache.get('similar_common_ingredients')
+    if common is None:
+        common = list(RecipeIngredient.objects.values(
+            'ingredient_id'
+        ).annotate(recipes=Count('recipe_id')).filter(
+            recipes__gt=settings.SIMILAR_RECIPES_MAX_INGREDIENT_RECIPES
+        ).values_list('ingredient_id', flat=True))
+        cache.set('similar_common_ingredients', common, 60 * 60)
+    return common
+
+
+def get_neighbourhood(recipe_ids):
+    """Рецепты, у которых с recipe_ids есть общий не частый ингредиент."""
+    return RecipeIngredient.objects.filter(
+        ingredient_id__in=RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).exclude(
+            ingredient_id__in=get_common_ingredients()
+        ).values('ingredient_id')
+    ).values('recipe_id')
+
+
+def refresh_similar_lists(recipe_ids, count=None):
+    """Пересчитывает списки похожих рецептов recipe_ids целиком."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    count = count or settings.SIMILAR_RECIPES_COUNT
+    index = SimilarityIndex.load(get_neighbourhood(recipe_ids))
+    rows = []
+    for recipe_id in recipe_ids:
+        ids, scores = index.top(recipe_id, count)
+        rows.extend(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for similar_id, score in zip(ids.tolist(), scores.tolist()))
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        SimilarRecipe.objects.bulk_create(rows)
+
+
+def update_similar_recipes(recipe_id, count=None):
+    """Обновляет похожие рецепты после создания или изменения рецепта.
+
+    Загружаются только рецепты с общими не частыми ингредиентами:
+    пересчитывается список самого рецепта, а в списки соседей он
+    добавляется, если входит в их count лучших. Соседи, из списков которых
+    рецепт выпал, пересчитываются целиком, чтобы место занял следующий
+    кандидат.
+    """
+    count = count or settings.SIMILAR_RECIPES_COUNT
+    index = SimilarityIndex.load(get_neighbourhood([recipe_id]))
+    ids, scores = index.scores(recipe_id)
+    top_ids, top_scores = select_top(ids, scores, count)
+
+    with transaction.atomic():
+        holders = set(SimilarRecipe.objects.filter(
+            similar_id=recipe_id).values_list('recipe_id', flat=True))
+        SimilarRecipe.objects.filter(recipe_id=recipe_id).delete()
+        SimilarRecipe.objects.filter(similar_id=recipe_id).delete()
+        rows = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for similar_id, score in zip(top_ids.tolist(),
+                                         top_scores.tolist())
+        ]
+
+        current = {}
+        for pk, neighbour_id, score in SimilarRecipe.objects.filter(
+            recipe_id__in=ids.tolist()
+        ).values_list('pk', 'recipe_id', 'score'):
+            current.setdefault(neighbour_id, []).append((score, pk))
+        displaced = []
+        for neighbour_id, score in zip(ids.tolist(), scores.tolist()):
+            neighbours = current.get(neighbour_id, [])
+            if len(neighbours) >= count:
+                worst_score, worst_pk = min(neighbours)
+                if worst_score >= score:
+                    continue
+                displaced.append(worst_pk)
+            holders.discard(neighbour_id)
+            rows.append(SimilarRecipe(recipe_id=neighbour_id,
+                                      similar_id=recipe_id, score=score))
+        SimilarRecipe.objects.filter(pk__in=displaced).delete()
+        SimilarRecipe.objects.bulk_create(rows)
+    refresh_similar_lists(holders, count)
+
+
+_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _run_in_background(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Не удалось обновить похожие рецепты')
+    finally:
+        # Соединения фонового потока не закрывает обработчик запросов.
+        connections.close_all()
+
+
+def apply_pending(batch_size=100):
+    """Выполняет обновления из очереди PendingSimilarity.
+
+    Записи разбираются пачками; на PostgreSQL пачку, которую уже
+    обрабатывает другой процесс, пропускают. Возвращает число
+    обработанных записей.
+    """
+    done = 0
+    while True:
+        with transaction.atomic():
+            tasks = list(PendingSimilarity.objects.select_for_update(
+                skip_locked=True).values_list(
+                    'id', 'recipe_id', 'list_only')[:batch_size])
+            if not tasks:
+                return done
+            # Удалённые рецепты пропускаются: их соседей пересчитывает
+            # отдельная запись.
+            existing = set(Recipe.objects.filter(id__in={
+                recipe_id for _, recipe_id, _ in tasks
+            }).values_list('id', flat=True))
+            updated = {recipe_id for _, recipe_id, list_only in tasks
+                       if not list_only} & existing
+            for recipe_id in updated:
+                update_similar_recipes(recipe_id)
+            # Обновление рецепта пересчитывает и его собственный список.
+            refresh_similar_lists({
+                recipe_id for _, recipe_id, list_only in tasks if list_only
+            } & existing - updated)
+            PendingSimilarity.objects.filter(
+                id__in=[id for id, _, _ in tasks]).delete()
+        done += len(tasks)
+
+
+def schedule(recipe_ids, list_only=False):
+    """Ставит обновление похожих рецептов recipe_ids в очередь.
+
+    Очередь пишется в текущей транзакции, а после её фиксации разбирается
+    фоновым потоком процесса, не задерживая ответ. Если воркер остановился
+    раньше, записи разберёт следующее изменение или команда
+    build_similar_recipes --pending, которую стоит запускать по расписанию.
+    С list_only пересчитываются только списки самих рецептов.
+    """
+    PendingSimilarity.objects.bulk_create(
+        PendingSimilarity(recipe_id=recipe_id, list_only=list_only)
+        for recipe_id in recipe_ids)
+    transaction.on_commit(
+        lambda: _executor.submit(_run_in_background, apply_pending))
@@ -7,7 +7,8 @@ from users.models import User
 
 class UserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name')
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
+    show_full_result_count = False
 
 
 admin.site.register(User, UserAdmin)
@@ -15,6 +16,10 @@ admin.site.register(User, UserAdmin)
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
 
 
 admin.site.register(Follow, FollowAdmin)